@@ -8,6 +8,8 @@ Updated for Render deployment with proper OAuth flow support
 import os
 import sys
 import json
+import base64
+import hmac
 import threading
 import time
 import signal
@@ -26,9 +28,6 @@ except ImportError:
 from flask import Flask, render_template_string, jsonify, request
 from flask_cors import CORS
 
-# Import the updated email processor
-from email_processor import EnhancedGmailProcessor 
-
 # Configure logging for Render (no file logging)
 log_level = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper())
 logging.basicConfig(
@@ -50,9 +49,17 @@ class EmailProcessorService:
         self.processing_thread = None
         self.should_stop = False
         self.config = self.load_config()
+        # Kept out of self.config, which get_status exposes through the API
+        self.pubsub_verification_token = os.getenv('PUBSUB_VERIFICATION_TOKEN', '')
         self.system_logs = []
         self.authentication_status = None
         
+        # Push notifications are coalesced onto at most one worker thread
+        self._push_state_lock = threading.Lock()
+        self._push_thread = None
+        self._push_requested = False
+        self._push_history_id = None
+        
         # Initialize processor on startup if auto_start is enabled
         if self.config.get('auto_start', False):
             logger.info("Auto-start enabled, initializing processor...")
@@ -78,7 +85,9 @@ class EmailProcessorService:
             'max_emails': int(os.getenv('MAX_EMAILS_PER_CHECK', '50')),
             'webhook_url': os.getenv('WEBHOOK_URL', ''),
             'auto_start': os.getenv('AUTO_START', 'false').lower() == 'true',
-            'archive_processed': os.getenv('ARCHIVE_PROCESSED_EMAILS', 'true').lower() == 'true'
+            'archive_processed': os.getenv('ARCHIVE_PROCESSED_EMAILS', 'true').lower() == 'true',
+            'pubsub_topic': os.getenv('GMAIL_PUBSUB_TOPIC', ''),
+            'push_fallback_interval': int(os.getenv('PUSH_FALLBACK_INTERVAL_SECONDS', '900'))
         }
     
     def initialize_processor(self) -> bool:
@@ -99,7 +108,8 @@ class EmailProcessorService:
                 self.log_message("No webhook URL configured - webhooks will be skipped")
                 logger.warning("No webhook URL configured - webhooks will be skipped")
             
-            # Initialize processor
+            # Initialize processor; the Google client stack is only imported once it is needed
+            from email_processor import EnhancedGmailProcessor
             self.processor = EnhancedGmailProcessor(webhook_url=self.config['webhook_url'])
             
             # Attempt authentication
@@ -234,9 +244,16 @@ class EmailProcessorService:
         
         while self.is_running and not self.should_stop:
             try:
+                # With Gmail push notifications active, polling is only a slow safety net
+                push_enabled = self.push_configured() and self.processor.ensure_watch()
+                interval = self.config['push_fallback_interval'] if push_enabled else self.config['check_interval']
+                
                 if not self.is_paused:
                     self.log_message("Processing emails...")
-                    results = self.processor.process_emails()
+                    if push_enabled:
+                        results = self.processor.process_new_mail(full_scan=True)
+                    else:
+                        results = self.processor.process_emails()
                     
                     if results['processed'] > 0:
                         message = f"Processed {results['processed']} emails, {results['successful_webhooks']} webhooks successful, {results['archived']} archived"
@@ -244,7 +261,7 @@ class EmailProcessorService:
                         logger.info(message)
                 
                 # Wait for the configured interval (with early exit capability)
-                for _ in range(self.config['check_interval']):
+                for _ in range(interval):
                     if self.should_stop or not self.is_running:
                         break
                     time.sleep(1)
@@ -262,6 +279,51 @@ class EmailProcessorService:
         self.log_message("Processing loop ended")
         logger.info("Processing loop ended")
     
+    def push_configured(self) -> bool:
+        """Push needs both a Pub/Sub topic and the shared secret that authenticates deliveries"""
+        return bool(self.config['pubsub_topic'] and self.pubsub_verification_token)
+    
+    def push_active(self) -> bool:
+        """Whether pushes should be accepted: configured, with a live Gmail watch"""
+        return self.push_configured() and self.processor is not None and self.processor.watch_active()
+    
+    def handle_push_notification(self, history_id: Optional[str]) -> bool:
+        """Process mail announced by a Gmail push notification in the background"""
+        if not self.processor or not self.is_running or self.is_paused:
+            return False
+        
+        # Pushes arriving while a pass runs are folded into one follow-up pass
+        with self._push_state_lock:
+            self._push_requested = True
+            if history_id:
+                self._push_history_id = history_id
+            if self._push_thread is None:
+                self._push_thread = threading.Thread(target=self._process_push, daemon=True)
+                self._push_thread.start()
+        return True
+    
+    def _process_push(self):
+        """Run push-triggered processing until no notification is pending and log the outcome"""
+        while True:
+            with self._push_state_lock:
+                if not self._push_requested:
+                    self._push_thread = None
+                    return
+                self._push_requested = False
+                history_id, self._push_history_id = self._push_history_id, None
+            
+            try:
+                results = self.processor.process_new_mail(history_id)
+                
+                if results.get('processed', 0) > 0:
+                    message = f"Push notification: processed {results['processed']} emails, {results['successful_webhooks']} webhooks successful, {results['archived']} archived"
+                    self.log_message(message)
+                    
+            except Exception as e:
+                error_msg = f"Error handling push notification: {e}"
+                self.log_message(error_msg)
+                logger.error(error_msg)
+    
     def get_status(self) -> Dict:
         """Get current processor status"""
         return {
@@ -372,6 +434,7 @@ class EmailProcessorService:
         """Set up OAuth credentials manually"""
         try:
             if not self.processor:
+                from email_processor import EnhancedGmailProcessor
                 self.processor = EnhancedGmailProcessor(webhook_url=self.config['webhook_url'])
             
             self.log_message("Starting OAuth setup...")
@@ -1317,6 +1380,34 @@ def clear_processed():
         logger.error(f"Error clearing processed data: {e}")
         return jsonify({'success': False, 'message': f'エラー: {str(e)}'}), 500
 
+@app.route('/api/gmail/push', methods=['POST'])
+def gmail_push():
+    """Receive Gmail change notifications from a Cloud Pub/Sub push subscription"""
+    # Push is off unless a topic and its shared secret (?token=... on the subscription) are set
+    if not processor_service.push_configured():
+        return jsonify({'error': 'push notifications not configured'}), 404
+    
+    token = processor_service.pubsub_verification_token
+    # Compared as bytes; compare_digest raises TypeError on non-ASCII str
+    if not hmac.compare_digest(request.args.get('token', '').encode(), token.encode()):
+        return jsonify({'error': 'invalid token'}), 403
+    
+    if not processor_service.push_active():
+        return jsonify({'error': 'no active Gmail watch'}), 404
+    
+    try:
+        envelope = request.get_json(silent=True) or {}
+        data = envelope.get('message', {}).get('data', '')
+        notification = json.loads(base64.b64decode(data)) if data else {}
+        history_id = notification.get('historyId')
+        
+        processor_service.handle_push_notification(str(history_id) if history_id else None)
+    except Exception as e:
+        logger.error(f"Error handling Gmail push notification: {e}")
+    
+    # Always acknowledge so Pub/Sub does not redeliver; the fallback poll catches misses
+    return '', 204
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for deployment platforms"""
@@ -1359,6 +1450,9 @@ def run_app():
         logger.info(f"  Webhook URL: {'Configured' if config['webhook_url'] else 'Not configured'}")
         logger.info(f"  Auto start: {config['auto_start']}")
         logger.info(f"  Archive processed: {config['archive_processed']}")
+        logger.info(f"  Push notifications: {'Configured' if processor_service.push_configured() else 'Not configured'}")
+        if config['pubsub_topic'] and not processor_service.pubsub_verification_token:
+            logger.warning("GMAIL_PUBSUB_TOPIC is set without PUBSUB_VERIFICATION_TOKEN; push notifications are disabled")
         
         # Determine host and port for Render
         host = os.getenv('HOST', '0.0.0.0')
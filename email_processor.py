@@ -1,29 +1,36 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import json
 import re
 import requests
-import base64
+import binascii
 import time
 import logging
 import sqlite3
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Tuple, Set, Callable, Sequence, Mapping
 import pickle
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, build_http
+import google_auth_httplib2
 import html
 import unicodedata
 import threading
 from pathlib import Path
 import tempfile
 from dataclasses import dataclass, field
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 import hashlib
+import functools
+from statistics import fmean
 import backoff
 
 # Load environment variables from .env file if available
@@ -33,6 +40,31 @@ try:
 except ImportError:
     pass  # dotenv is optional
 
+# selectolax provides a C-backed HTML parser; fall back to regex stripping without it
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# google-re2 gives linear-time matching on untrusted email text. It is opt-in through
+# EXTRACTION_REGEX_ENGINE=re2 because its \b, \d and \s are ASCII-only, unlike re's
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+# orjson serializes straight to UTF-8 bytes in native code; stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# pyahocorasick finds every relevance keyword in one pass; per-keyword scans are the fallback
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # Configure logging with better formatting
 logging.basicConfig(
     level=logging.INFO,
@@ -43,7 +75,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@dataclass
+def _json_bytes(data: Any, sort_keys: bool = False) -> bytes:
+    """Serialize data to compact UTF-8 encoded JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(data, ensure_ascii=False, sort_keys=sort_keys, separators=(',', ':')).encode('utf-8')
+
+# Maps the URL-safe base64 alphabet used by the Gmail API onto the standard one
+_URLSAFE_TRANS = bytes.maketrans(b'-_', b'+/')
+
+def _decode_base64url(data: str) -> str:
+    """Decode a Gmail base64url body to text in a single C-level pass"""
+    encoded = data.encode('ascii').translate(_URLSAFE_TRANS)
+    # Gmail strips the padding; restore exactly what is missing
+    padding = -len(encoded) % 4
+    if padding:
+        encoded += b'=' * padding
+    return binascii.a2b_base64(encoded).decode('utf-8', errors='ignore')
+
+# Whitespace cleanup for HTML-derived text: tabs become spaces, then blank-line
+# runs and repeated spaces are collapsed in one pass
+_TAB_TO_SPACE = str.maketrans('\t', ' ')
+_WHITESPACE_RUN_RE = re.compile(r'\n\s*\n| {2,}')
+
+def _collapse_whitespace_run(match: re.Match) -> str:
+    return '\n\n' if match.group()[0] == '\n' else ' '
+
+# First/last characters of a stripped value that the affix regex below can remove
+_AFFIX_FIRST_CHARS = frozenset('：:')
+_AFFIX_LAST_CHARS = frozenset('：:様殿ん')
+
+# Leading colon, or trailing colon and honorific suffixes (様/さん/殿) in the
+# order clean_generic_value used to strip them one by one
+_UNWANTED_AFFIX_RE = re.compile(r'^\s*[：:]\s*|(?:\s*殿)?(?:\s*さん)?(?:\s*様)?(?:\s*[：:])?\s*$')
+
+# Values made up only of punctuation/symbols (no word, kana or kanji characters)
+_JUNK_ONLY_RE = re.compile(r'^[^\w\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF]+$')
+
+# slots=True needs Python 3.10+; older interpreters keep regular dataclasses
+_DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_OPTIONS)
 class ExtractedField:
     """Represents an extracted field with confidence and metadata"""
     value: str
@@ -52,34 +124,49 @@ class ExtractedField:
     position: int = 0
     validation_passed: bool = True
 
-@dataclass 
+@dataclass(**_DATACLASS_OPTIONS)
 class ProcessingResult:
     """Result of email processing"""
     success: bool
     email_id: str
     extracted_fields: Dict[str, ExtractedField] = field(default_factory=dict)
     universal_data: Dict = field(default_factory=dict)
+    universal_json: bytes = b''
     webhook_sent: bool = False
     archived: bool = False
     error_message: str = ""
 
+# Accepted email address shape, matched against the whole stripped value
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+def _average_confidence(fields: Dict[str, ExtractedField]) -> float:
+    """Mean confidence of extracted fields, 0.0 when there are none"""
+    if not fields:
+        return 0.0
+    return fmean(field.confidence for field in fields.values())
+
+_DIGIT_RUN_RE = re.compile(r'\d+')
+
+# Characters stripped from phone values that fail validation
+_PHONE_JUNK_RE = re.compile(r'[^\d\-\(\)\s]')
+
 class FieldValidator:
     """Validates extracted field values"""
     
     @staticmethod
     def validate_email(value: str) -> Tuple[bool, str]:
         """Validate email address format"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if re.match(pattern, value.strip()):
-            return True, value.strip().lower()
+        candidate = value.strip()
+        # Most non-email candidates have no '@'; reject those before running the regex
+        if '@' in candidate and _EMAIL_RE.fullmatch(candidate):
+            return True, candidate.lower()
         return False, value
     
     @staticmethod
     def validate_phone(value: str) -> Tuple[bool, str]:
         """Validate and normalize phone number"""
-        # Remove all non-digit characters except hyphens and parentheses
-        cleaned = re.sub(r'[^\d\-\(\)\s]', '', value)
-        digits = re.sub(r'[^\d]', '', cleaned)
+        # Collect the digits in one pass (str.isdecimal matches exactly what \d does)
+        digits = ''.join(filter(str.isdecimal, value))
         
         # Japanese phone numbers: mobile (11 digits) or landline (10-11 digits)
         if len(digits) in [10, 11]:
@@ -94,7 +181,8 @@ class FieldValidator:
                 formatted = f"{digits[:2]}-{digits[2:6]}-{digits[6:]}"
                 return True, formatted
         
-        return False, cleaned
+        # Remove all non-digit characters except hyphens and parentheses
+        return False, _PHONE_JUNK_RE.sub('', value)
     
     @staticmethod
     def validate_postal_code(value: str) -> Tuple[bool, str]:
@@ -108,9 +196,10 @@ class FieldValidator:
     @staticmethod
     def validate_age(value: str) -> Tuple[bool, str]:
         """Validate age value"""
-        numbers = re.findall(r'\d+', value)
-        if numbers:
-            age = int(numbers[0])
+        # Only the first digit run matters; stop scanning there
+        number = _DIGIT_RUN_RE.search(value)
+        if number:
+            age = int(number.group())
             if 0 <= age <= 120:
                 return True, str(age)
         return False, value
@@ -135,6 +224,18 @@ class FieldValidator:
             return True, value
         return False, value
 
+# Full-width digits and Latin letters mapped to their ASCII forms, plus common
+# Japanese punctuation, applied together in one translate pass
+_NORMALIZE_TRANS = str.maketrans(
+    '０１２３４５６７８９ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ'
+    '：；，．（）「」〜～・',
+    '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+    ':;,.()""~~·'
+)
+_WHITESPACE_RE = re.compile(r'\s+')
+# "key: value" on a single line; the key may not contain a colon
+_KEY_VALUE_RE = re.compile(r'^([^:：\n]+)[：:]([^\n]+)$', re.MULTILINE)
+
 class EnhancedTextProcessor:
     """Enhanced text processing with better Japanese support"""
     
@@ -144,26 +245,16 @@ class EnhancedTextProcessor:
         if not text:
             return ""
         
-        # Unicode normalization
-        text = unicodedata.normalize('NFKC', text)
-        
-        # Convert full-width to half-width for ASCII characters
-        text = text.translate(str.maketrans(
-            '０１２３４５６７８９ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ',
-            '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
-        ))
-        
-        # Normalize common punctuation
-        replacements = {
-            '：': ':', '；': ';', '，': ',', '．': '.', 
-            '（': '(', '）': ')', '「': '"', '」': '"',
-            '〜': '~', '～': '~', '・': '·'
-        }
-        for old, new in replacements.items():
-            text = text.replace(old, new)
+        # ASCII text is unchanged by NFKC and the translation table
+        if not text.isascii():
+            # Unicode normalization
+            text = unicodedata.normalize('NFKC', text)
+            
+            # Convert full-width ASCII characters and common punctuation
+            text = text.translate(_NORMALIZE_TRANS)
         
         # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE_RE.sub(' ', text)
         
         return text.strip()
     
@@ -176,29 +267,43 @@ class EnhancedTextProcessor:
         normalized_text = EnhancedTextProcessor.normalize_text(text)
         extracted = {}
         
-        # Split into logical sections
-        sections = re.split(r'\n\s*\n', normalized_text)
-        
-        for section in sections:
-            # Extract key-value pairs
-            lines = section.split('\n')
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Look for colon-separated pairs
-                colon_match = re.search(r'^([^:：]+)[：:](.+)$', line)
-                if colon_match:
-                    key = colon_match.group(1).strip()
-                    value = colon_match.group(2).strip()
-                    if key and value:
-                        if key not in extracted:
-                            extracted[key] = []
-                        extracted[key].append(value)
+        # Scan all lines for colon-separated key-value pairs in one pass
+        for colon_match in _KEY_VALUE_RE.finditer(normalized_text):
+            key = colon_match.group(1).strip()
+            value = colon_match.group(2).strip()
+            if key and value:
+                if key not in extracted:
+                    extracted[key] = []
+                extracted[key].append(value)
         
         return extracted
 
+def _lower_aligned(text: str) -> Optional[str]:
+    """Lowercase text once, or None when lowering changes its length and offsets would drift"""
+    lowered = text.lower()
+    return lowered if len(lowered) == len(text) else None
+
+def _with_age_suffix(value: str) -> str:
+    return value if value.endswith(("歳", "才")) else value + "歳"
+
+def _with_postal_mark(value: str) -> str:
+    return value if value.startswith("〒") else "〒" + value
+
+# Display form applied to validated values before they become ExtractedFields
+_FIELD_NORMALIZERS: Dict[str, Callable[[str], str]] = {
+    'age': _with_age_suffix,
+    'postal_code': _with_postal_mark,
+}
+
+# Keywords near a match that raise its confidence, per field
+_CONTEXT_KEYWORDS = {
+    'name': ('名前', 'name', '氏名', 'お客様'),
+    'email': ('メール', 'mail', 'アドレス', '連絡先'),
+    'phone': ('電話', 'tel', 'phone', '携帯', '番号'),
+    'address': ('住所', 'address', '所在地'),
+    'inquiry': ('問い合わせ', 'inquiry', '質問', '相談')
+}
+
 class SmartFieldExtractor:
     """Enhanced field extraction with multiple strategies"""
     
@@ -206,9 +311,11 @@ class SmartFieldExtractor:
         self.validator = FieldValidator()
         self.text_processor = EnhancedTextProcessor()
     
-    def get_extraction_patterns(self) -> Dict[str, List[Dict]]:
-        """Get improved extraction patterns with confidence scores"""
-        return {
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def get_extraction_patterns() -> Mapping[str, Tuple[Mapping[str, Any], ...]]:
+        """Get improved extraction patterns with confidence scores (built once, read-only)"""
+        patterns = {
             'name': [
                 {
                     'pattern': r'(?:お?名前|氏名|申込者名|ご依頼者)[：:\s]*([^\n\r]{1,50}?)(?:\s*(?:\n|$|フリガナ|ふりがな))',
@@ -359,25 +466,36 @@ class SmartFieldExtractor:
                 }
             ]
         }
+        
+        # Frozen so the cached table cannot be mutated by a caller
+        return MappingProxyType({
+            field_name: tuple(MappingProxyType(info) for info in pattern_list)
+            for field_name, pattern_list in patterns.items()
+        })
     
-    def extract_field(self, text: str, field_name: str) -> List[ExtractedField]:
-        """Extract field with multiple patterns and confidence scoring"""
+    def extract_field(self, text: str, field_name: str, lowered_text: Optional[str] = None) -> List[ExtractedField]:
+        """Extract field with multiple patterns and confidence scoring
+        
+        lowered_text, when given, must be text.lower() with the same length; it lets
+        context scoring slice keyword windows instead of lowering them per match.
+        """
         if not text or not field_name:
             return []
         
-        patterns = self.get_extraction_patterns().get(field_name, [])
+        patterns = _COMPILED_PATTERNS.get(field_name)
         if not patterns:
             return []
         
+        # Skip the per-pattern passes when no pattern for this field occurs at all
+        if not _FIELD_SCREENS[field_name].search(text):
+            return []
+        
         extracted_fields = []
+        normalize = _FIELD_NORMALIZERS.get(field_name)
         
-        for pattern_info in patterns:
-            pattern = pattern_info['pattern']
-            base_confidence = pattern_info['confidence']
-            description = pattern_info.get('description', '')
-            
+        for pattern, base_confidence, description in patterns:
             try:
-                matches = re.finditer(pattern, text, re.MULTILINE | re.DOTALL | re.IGNORECASE)
+                matches = pattern.finditer(text)
                 
                 for match in matches:
                     value = match.group(1).strip() if match.groups() else match.group(0).strip()
@@ -389,8 +507,11 @@ class SmartFieldExtractor:
                     is_valid, cleaned_value = self.validate_field_value(field_name, value)
                     
                     if is_valid and cleaned_value:
+                        if normalize is not None:
+                            cleaned_value = normalize(cleaned_value)
+                        
                         # Calculate confidence based on context
-                        context_bonus = self.calculate_context_confidence(text, match.start(), field_name)
+                        context_bonus = self.calculate_context_confidence(text, match.start(), field_name, lowered_text)
                         final_confidence = min(0.99, base_confidence + context_bonus)
                         
                         extracted_field = ExtractedField(
@@ -411,6 +532,18 @@ class SmartFieldExtractor:
         extracted_fields.sort(key=lambda x: (-x.confidence, x.position))
         return self.deduplicate_fields(extracted_fields)
     
+    def extract_all_fields(self, text: str, field_names: Sequence[str],
+                           lowered_text: Optional[str] = None) -> Dict[str, List[ExtractedField]]:
+        """Extract several fields from the same text; fields without a match are left out"""
+        if lowered_text is None:
+            lowered_text = _lower_aligned(text)
+        results = {}
+        for field_name in field_names:
+            extracted_fields = self.extract_field(text, field_name, lowered_text)
+            if extracted_fields:
+                results[field_name] = extracted_fields
+        return results
+    
     def validate_field_value(self, field_name: str, value: str) -> Tuple[bool, str]:
         """Validate field value using appropriate validator"""
         validation_methods = {
@@ -426,7 +559,7 @@ class SmartFieldExtractor:
         
         # Default validation - clean and check length
         cleaned = self.clean_generic_value(value)
-        is_valid = len(cleaned) >= 2 and not re.match(r'^[^\w\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FAF]+$', cleaned)
+        is_valid = len(cleaned) >= 2 and not _JUNK_ONLY_RE.match(cleaned)
         return is_valid, cleaned
     
     def clean_generic_value(self, value: str) -> str:
@@ -434,60 +567,92 @@ class SmartFieldExtractor:
         if not value:
             return ""
         
-        # Remove unwanted patterns
-        unwanted_patterns = [
-            r'^\s*[：:]\s*',  # Leading colon
-            r'\s*[：:]\s*$',  # Trailing colon
-            r'\s*様\s*$',     # Honorific suffix
-            r'\s*さん\s*$',
-            r'\s*殿\s*$'
-        ]
-        
         cleaned = value.strip()
-        for pattern in unwanted_patterns:
-            cleaned = re.sub(pattern, '', cleaned).strip()
         
-        return cleaned
+        # Most values neither start with a colon nor end in a colon or honorific
+        if cleaned[:1] not in _AFFIX_FIRST_CHARS and cleaned[-1:] not in _AFFIX_LAST_CHARS:
+            return cleaned
+        
+        # Remove leading/trailing colons and honorific suffixes
+        return _UNWANTED_AFFIX_RE.sub('', cleaned).strip()
     
-    def calculate_context_confidence(self, text: str, position: int, field_name: str) -> float:
+    def calculate_context_confidence(self, text: str, position: int, field_name: str,
+                                     lowered_text: Optional[str] = None) -> float:
         """Calculate confidence bonus based on surrounding context"""
+        keywords = _CONTEXT_KEYWORDS.get(field_name)
+        if not keywords:
+            return 0.0  # No context keywords for this field; skip building the window
+        
         context_window = 100
         start = max(0, position - context_window)
         end = min(len(text), position + context_window)
-        context = text[start:end].lower()
-        
-        context_keywords = {
-            'name': ['名前', 'name', '氏名', 'お客様'],
-            'email': ['メール', 'mail', 'アドレス', '連絡先'],
-            'phone': ['電話', 'tel', 'phone', '携帯', '番号'],
-            'address': ['住所', 'address', '所在地'],
-            'inquiry': ['問い合わせ', 'inquiry', '質問', '相談']
-        }
+        context = lowered_text[start:end] if lowered_text is not None else text[start:end].lower()
         
-        keywords = context_keywords.get(field_name, [])
         bonus = 0.0
         
         for keyword in keywords:
             if keyword in context:
                 bonus += 0.1
+                if bonus >= 0.2:
+                    break  # Already at the cap
         
         return min(0.2, bonus)  # Max bonus of 0.2
     
     def deduplicate_fields(self, fields: List[ExtractedField]) -> List[ExtractedField]:
-        """Remove duplicate field values, keeping highest confidence"""
+        """Remove duplicate field values, keeping highest confidence
+        
+        Expects fields sorted by descending confidence, so the first occurrence of a value wins.
+        """
         if not fields:
             return fields
         
-        seen_values = {}
+        seen_values = set()
         deduplicated = []
         
         for field in fields:
             normalized_value = field.value.lower().strip()
             
-            if normalized_value not in seen_values or seen_values[normalized_value].confidence < field.confidence:
-                seen_values[normalized_value] = field
+            if normalized_value not in seen_values:
+                seen_values.add(normalized_value)
+                deduplicated.append(field)
         
-        return list(seen_values.values())
+        return deduplicated
+
+# Extraction patterns compiled once at import; shared read-only by all extractors and threads
+_EXTRACTION_FLAGS = re.MULTILINE | re.DOTALL | re.IGNORECASE
+_USE_RE2 = re2 is not None and os.getenv('EXTRACTION_REGEX_ENGINE', 're').lower() == 're2'
+
+def _compile_extraction_pattern(pattern: str):
+    """Compile an extraction pattern with RE2 when enabled, falling back to re per pattern"""
+    if _USE_RE2:
+        try:
+            # RE2 takes the same flags inline: i=IGNORECASE, m=MULTILINE, s=DOTALL
+            return re2.compile('(?ims)' + pattern)
+        except Exception as e:
+            logger.debug(f"RE2 cannot compile pattern, using re: {e}")
+    return re.compile(pattern, _EXTRACTION_FLAGS)
+
+_PATTERN_SPECS = SmartFieldExtractor.get_extraction_patterns()
+_COMPILED_PATTERNS: Dict[str, List[Tuple[re.Pattern, float, str]]] = {
+    field_name: [
+        (_compile_extraction_pattern(info['pattern']), info['confidence'], info.get('description', ''))
+        for info in pattern_list
+    ]
+    for field_name, pattern_list in _PATTERN_SPECS.items()
+}
+
+# One alternation per field: a single search tells whether any of its patterns can match.
+# Matching stays per pattern, since a fused finditer would let one alternative consume
+# text that another pattern is expected to match.
+_FIELD_SCREENS: Dict[str, re.Pattern] = {
+    field_name: _compile_extraction_pattern(
+        '|'.join(f"(?:{info['pattern']})" for info in pattern_list)
+    )
+    for field_name, pattern_list in _PATTERN_SPECS.items()
+}
+
+# Maximum ids per IN-list query in get_processed_ids
+_MAX_SQL_PARAMS = 900
 
 class EmailDatabase:
     """Enhanced SQLite database manager with better error handling and connection management"""
@@ -500,23 +665,30 @@ class EmailDatabase:
             self.db_path = db_path
         
         self._connection_lock = threading.RLock()
+        self._local = threading.local()
+        # Registry of every thread's connection, used only to close those of finished threads
         self._connection_pool = {}
         self.init_database()
         
     def get_connection(self):
         """Get a thread-safe database connection"""
-        thread_id = threading.get_ident()
+        # Each thread owns its connection, so the common path needs no lock
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        
+        # check_same_thread=False only so cleanup_old_connections can close it from another thread
+        conn = sqlite3.connect(self.db_path, timeout=30.0, cached_statements=256, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=10000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self._local.conn = conn
         
         with self._connection_lock:
-            if thread_id not in self._connection_pool:
-                conn = sqlite3.connect(self.db_path, timeout=30.0)
-                conn.execute("PRAGMA journal_mode=WAL")
-                conn.execute("PRAGMA synchronous=NORMAL")
-                conn.execute("PRAGMA cache_size=10000")
-                conn.execute("PRAGMA temp_store=MEMORY")
-                self._connection_pool[thread_id] = conn
-            
-            return self._connection_pool[thread_id]
+            self._connection_pool[threading.get_ident()] = conn
+        
+        return conn
     
     def init_database(self):
         """Initialize the SQLite database with required tables"""
@@ -537,7 +709,7 @@ class EmailDatabase:
                         processed_date TEXT DEFAULT CURRENT_TIMESTAMP,
                         webhook_sent BOOLEAN DEFAULT FALSE,
                         archived BOOLEAN DEFAULT FALSE,
-                        json_data TEXT,
+                        json_data BLOB,
                         extraction_confidence REAL DEFAULT 0.0,
                         field_count INTEGER DEFAULT 0,
                         processing_time_ms INTEGER DEFAULT 0,
@@ -587,17 +759,27 @@ class EmailDatabase:
             logger.error(f"Failed to initialize database: {e}")
             raise
     
-    def is_email_processed(self, email_id: str) -> bool:
-        """Check if an email has already been processed"""
+    def get_processed_ids(self, email_ids: List[str]) -> Set[str]:
+        """Return the subset of email_ids that have already been processed, in one query"""
+        if not email_ids:
+            return set()
+        
         try:
-            with self._connection_lock:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT 1 FROM processed_emails WHERE email_id = ?", (email_id,))
-                return cursor.fetchone() is not None
+            conn = self.get_connection()
+            processed = set()
+            # Chunked to stay under SQLite's default limit of 999 bound parameters
+            for start in range(0, len(email_ids), _MAX_SQL_PARAMS):
+                chunk = email_ids[start:start + _MAX_SQL_PARAMS]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = conn.execute(
+                    f"SELECT email_id FROM processed_emails WHERE email_id IN ({placeholders})",
+                    chunk
+                )
+                processed.update(row[0] for row in cursor)
+            return processed
         except Exception as e:
-            logger.error(f"Error checking if email is processed: {e}")
-            return False
+            logger.error(f"Error checking processed emails: {e}")
+            return set()
     
     def mark_email_processed(self, result: ProcessingResult):
         """Mark an email as processed with detailed information"""
@@ -607,53 +789,56 @@ class EmailDatabase:
                 cursor = conn.cursor()
                 
                 # Calculate metrics
-                avg_confidence = 0.0
-                if result.extracted_fields:
-                    confidences = [field.confidence for field in result.extracted_fields.values()]
-                    avg_confidence = sum(confidences) / len(confidences)
+                avg_confidence = _average_confidence(result.extracted_fields)
                 
                 field_count = len(result.extracted_fields)
                 
-                # Generate content hash for deduplication
-                content_str = json.dumps(result.universal_data, sort_keys=True)
-                content_hash = hashlib.md5(content_str.encode()).hexdigest()
+                # Stored as sent (reusing the bytes from analysis); the hash uses sorted keys
+                payload = result.universal_json or _json_bytes(result.universal_data)
                 
-                # Insert main record
-                cursor.execute('''
-                    INSERT OR REPLACE INTO processed_emails 
-                    (email_id, subject, sender, received_date, webhook_sent, json_data,
-                     extraction_confidence, field_count, error_message, content_hash)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    result.email_id,
-                    "",  # Will be filled by caller
-                    "",  # Will be filled by caller  
-                    "",  # Will be filled by caller
-                    result.webhook_sent,
-                    json.dumps(result.universal_data) if result.universal_data else None,
-                    avg_confidence,
-                    field_count,
-                    result.error_message or None,
-                    content_hash
-                ))
+                # Generate content hash for deduplication (BLAKE2b is faster than MD5; same hex length)
+                content_hash = hashlib.blake2b(_json_bytes(result.universal_data, sort_keys=True),
+                                               digest_size=16).hexdigest()
                 
-                # Insert extracted fields details
-                for field_name, field_data in result.extracted_fields.items():
+                # Both inserts share one transaction; it commits once, or rolls back on error
+                with conn:
+                    # Insert main record
                     cursor.execute('''
-                        INSERT INTO extracted_fields
-                        (email_id, field_name, field_value, confidence, source_pattern, validation_passed)
-                        VALUES (?, ?, ?, ?, ?, ?)
+                        INSERT OR REPLACE INTO processed_emails 
+                        (email_id, subject, sender, received_date, webhook_sent, json_data,
+                         extraction_confidence, field_count, error_message, content_hash)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     ''', (
                         result.email_id,
-                        field_name,
-                        field_data.value,
-                        field_data.confidence,
-                        field_data.source_pattern,
-                        field_data.validation_passed
+                        "",  # Will be filled by caller
+                        "",  # Will be filled by caller  
+                        "",  # Will be filled by caller
+                        result.webhook_sent,
+                        payload if result.universal_data else None,  # UTF-8 JSON bytes
+                        avg_confidence,
+                        field_count,
+                        result.error_message or None,
+                        content_hash
                     ))
+                    
+                    # Insert extracted fields details
+                    cursor.executemany('''
+                        INSERT INTO extracted_fields
+                        (email_id, field_name, field_value, confidence, source_pattern, validation_passed)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', [
+                        (
+                            result.email_id,
+                            field_name,
+                            field_data.value,
+                            field_data.confidence,
+                            field_data.source_pattern,
+                            field_data.validation_passed
+                        )
+                        for field_name, field_data in result.extracted_fields.items()
+                    ])
                 
-                conn.commit()
-                logger.info(f"Marked email {result.email_id} as processed (confidence: {avg_confidence:.2f})")
+                logger.info("Marked email %s as processed (confidence: %.2f)", result.email_id, avg_confidence)
                 
         except Exception as e:
             logger.error(f"Error marking email as processed: {e}")
@@ -724,144 +909,191 @@ class EmailDatabase:
                 except:
                     pass
 
+# Universal JSON template, built once; unpickling a fresh copy per email runs
+# entirely in C and is cheaper than rebuilding the literal or deepcopying it
+_UNIVERSAL_TEMPLATE: Dict[str, Any] = {
+    "sender_email(送信元メールアドレス)": "",
+    "timestamp(タイムスタンプ)": "",
+    "subject(件名)": "",
+    "processing_metadata": {
+        "extraction_confidence": 0.0,
+        "extracted_field_count": 0,
+        "processing_time_ms": 0,
+        "extraction_method": "smart_pattern_matching"
+    },
+    "company_info(会社情報)": {
+        "company_name(会社名)": "",
+        "branch_name(支店名)": "",
+        "received_datetime(受信日時)": "",
+        "id(ＩＤ)": "",
+        "serial_number(連番)": "",
+        "contact_datetime(お問合せ日時)": "",
+        "contact_plan(お問合せ企画)": "",
+        "delivery_type(反響送付先区分)": "",
+        "delivery_code(反響送付先コード)": "",
+        "url(URL)": ""
+    },
+    "staff_info(担当者情報)": {
+        "staff_in_charge(担当)": "",
+        "status(ステータス)": "",
+        "occurrence_type(発生区分)": ""
+    },
+    "event_info(イベント情報)": {
+        "event_name(イベント名)": "",
+        "event_date(開催日)": "",
+        "event_time(時間)": "",
+        "event_place(会場)": "",
+        "event_url(URL)": ""
+    },
+    "reservation_info(ご予約情報)": [{
+        "preferred_date(ご希望日)": "",
+        "preferred_time(ご希望時間)": "",
+        "reservation_status(予約状況)": "",
+        "meeting_place(集合場所)": "",
+        "reservation_id(予約ID)": "",
+        "property_type(物件種別)": "",
+        "property_code(物件コード)": "",
+        "property_name(物件名)": "",
+        "company_property_code(貴社物件コード)": "",
+        "location(所在地)": "",
+        "price(価格)": "",
+        "property_url(物件詳細画面)": ""
+    }],
+    "document_request_info(資料請求情報)": {
+        "requested_booklets(ご希望の冊子)": "",
+        "requested_properties(資料請求物件情報)": []
+    },
+    "inquiry_info(お問い合わせ内容)": {
+        "inquiry_text(お問い合わせ内容)": "",
+        "inquiry_source(お問い合わせのきっかけ)": ""
+    },
+    "survey_info(アンケート情報)": {
+        "preferred_area(ご希望エリア)": "",
+        "railway_line(沿線)": "",
+        "other_requests(その他ご要望)": "",
+        "school_district(学校区)": "",
+        "parking_spaces(駐車場台数)": "",
+        "floors(階数)": "",
+        "budget_total(総予算)": "",
+        "budget_monthly(希望返済額)": ""
+    },
+    "property_info(物件情報)": {
+        "company_name(会社名)": "",
+        "branch_name(支店名)": "",
+        "issue(掲載号)": "",
+        "property_type(物件種別)": "",
+        "property_code(物件コード)": "",
+        "property_name(物件名)": "",
+        "company_property_code(貴社物件コード)": "",
+        "nearest_station(最寄り駅)": "",
+        "bus_walk(バス／歩)": "",
+        "location(所在地)": "",
+        "price(価格)": "",
+        "land_area(土地面積)": "",
+        "building_area(建物面積)": "",
+        "property_url(物件詳細画面)": "",
+        "floor_plan(間取り)": "",
+        "age(築年数)": "",
+        "other_pr_points(その他PRポイント)": ""
+    },
+    "customer_info(お客様情報)": [{
+        "name(お名前)": "",
+        "furigana(フリガナ)": "",
+        "email(メールアドレス)": "",
+        "phone_number(電話番号)": "",
+        "phone_number2(電話番号2)": "",
+        "fax_number(FAX番号)": "",
+        "age(年齢)": "",
+        "postal_code(郵便番号)": "",
+        "address(ご住所)": "",
+        "monthly_rent(月々の家賃)": "",
+        "monthly_payment(月々の返済額)": "",
+        "preferred_area(希望エリア)": "",
+        "registration_reason(会員登録のきっかけ)": "",
+        "preferred_contact_method(希望連絡方法)": "",
+        "newsletter_opt_in(お知らせメール希望)": "",
+        "comments(ご意見・ご質問等)": ""
+    }],
+    "housing_preferences(希望条件情報)": {
+        "mansion_preferences(マンション希望条件情報)": {
+            "preferred_area(希望エリア)": "",
+            "school_district(希望校区)": "",
+            "price_range(希望価格)": "",
+            "floor_plan(希望間取り)": "",
+            "exclusive_area(希望専有面積)": "",
+            "pet_allowed(ペット可物件希望)": "",
+            "other_conditions(その他希望条件)": ""
+        },
+        "house_preferences(一戸建て希望条件情報)": {
+            "preferred_area(希望エリア)": "",
+            "school_district(希望校区)": "",
+            "price_range(希望価格)": "",
+            "floor_plan(希望間取り)": "",
+            "land_area(希望土地面積)": "",
+            "building_area(希望建物面積)": "",
+            "other_conditions(その他希望条件)": ""
+        }
+    }
+}
+_UNIVERSAL_TEMPLATE_BLOB = pickle.dumps(_UNIVERSAL_TEMPLATE, protocol=pickle.HIGHEST_PROTOCOL)
+
+# Field name -> key paths its value is written to in the universal JSON
+_CUSTOMER = ("customer_info(お客様情報)", 0)
+_FIELD_MAPPING: Dict[str, Tuple[Tuple, ...]] = {
+    'name': (_CUSTOMER + ("name(お名前)",),),
+    'furigana': (_CUSTOMER + ("furigana(フリガナ)",),),
+    'email': (_CUSTOMER + ("email(メールアドレス)",),),
+    'phone': (_CUSTOMER + ("phone_number(電話番号)",),),
+    'age': (_CUSTOMER + ("age(年齢)",),),
+    'postal_code': (_CUSTOMER + ("postal_code(郵便番号)",),),
+    'address': (_CUSTOMER + ("address(ご住所)",),),
+    'inquiry_text': (
+        ("inquiry_info(お問い合わせ内容)", "inquiry_text(お問い合わせ内容)"),
+        _CUSTOMER + ("comments(ご意見・ご質問等)",),
+    ),
+    'company_name': (
+        ("company_info(会社情報)", "company_name(会社名)"),
+        ("property_info(物件情報)", "company_name(会社名)"),
+    ),
+    'property_name': (
+        ("property_info(物件情報)", "property_name(物件名)"),
+        ("reservation_info(ご予約情報)", 0, "property_name(物件名)"),
+    ),
+    'price': (
+        ("property_info(物件情報)", "price(価格)"),
+        ("reservation_info(ご予約情報)", 0, "price(価格)"),
+    ),
+    # Map URL to most appropriate fields
+    'url': (
+        ("company_info(会社情報)", "url(URL)"),
+        ("event_info(イベント情報)", "event_url(URL)"),
+        ("property_info(物件情報)", "property_url(物件詳細画面)"),
+    ),
+}
+
 class UniversalJSONProcessor:
     """Enhanced JSON processor with flexible field mapping"""
     
+    # Fields the delivery gate relies on
+    KEY_FIELDS = ('name', 'email', 'phone', 'inquiry_text')
+    FIELD_ORDER = KEY_FIELDS + (
+        'furigana', 'age', 'postal_code', 'address',
+        'company_name', 'property_name', 'price', 'url'
+    )
+    
     def __init__(self):
         self.field_extractor = SmartFieldExtractor()
     
-    def get_universal_template(self) -> Dict[str, Any]:
-        """Returns the universal JSON template structure"""
-        return {
-            "sender_email(送信元メールアドレス)": "",
-            "timestamp(タイムスタンプ)": "",
-            "subject(件名)": "",
-            "processing_metadata": {
-                "extraction_confidence": 0.0,
-                "extracted_field_count": 0,
-                "processing_time_ms": 0,
-                "extraction_method": "smart_pattern_matching"
-            },
-            "company_info(会社情報)": {
-                "company_name(会社名)": "",
-                "branch_name(支店名)": "",
-                "received_datetime(受信日時)": "",
-                "id(ＩＤ)": "",
-                "serial_number(連番)": "",
-                "contact_datetime(お問合せ日時)": "",
-                "contact_plan(お問合せ企画)": "",
-                "delivery_type(反響送付先区分)": "",
-                "delivery_code(反響送付先コード)": "",
-                "url(URL)": ""
-            },
-            "staff_info(担当者情報)": {
-                "staff_in_charge(担当)": "",
-                "status(ステータス)": "",
-                "occurrence_type(発生区分)": ""
-            },
-            "event_info(イベント情報)": {
-                "event_name(イベント名)": "",
-                "event_date(開催日)": "",
-                "event_time(時間)": "",
-                "event_place(会場)": "",
-                "event_url(URL)": ""
-            },
-            "reservation_info(ご予約情報)": [{
-                "preferred_date(ご希望日)": "",
-                "preferred_time(ご希望時間)": "",
-                "reservation_status(予約状況)": "",
-                "meeting_place(集合場所)": "",
-                "reservation_id(予約ID)": "",
-                "property_type(物件種別)": "",
-                "property_code(物件コード)": "",
-                "property_name(物件名)": "",
-                "company_property_code(貴社物件コード)": "",
-                "location(所在地)": "",
-                "price(価格)": "",
-                "property_url(物件詳細画面)": ""
-            }],
-            "document_request_info(資料請求情報)": {
-                "requested_booklets(ご希望の冊子)": "",
-                "requested_properties(資料請求物件情報)": []
-            },
-            "inquiry_info(お問い合わせ内容)": {
-                "inquiry_text(お問い合わせ内容)": "",
-                "inquiry_source(お問い合わせのきっかけ)": ""
-            },
-            "survey_info(アンケート情報)": {
-                "preferred_area(ご希望エリア)": "",
-                "railway_line(沿線)": "",
-                "other_requests(その他ご要望)": "",
-                "school_district(学校区)": "",
-                "parking_spaces(駐車場台数)": "",
-                "floors(階数)": "",
-                "budget_total(総予算)": "",
-                "budget_monthly(希望返済額)": ""
-            },
-            "property_info(物件情報)": {
-                "company_name(会社名)": "",
-                "branch_name(支店名)": "",
-                "issue(掲載号)": "",
-                "property_type(物件種別)": "",
-                "property_code(物件コード)": "",
-                "property_name(物件名)": "",
-                "company_property_code(貴社物件コード)": "",
-                "nearest_station(最寄り駅)": "",
-                "bus_walk(バス／歩)": "",
-                "location(所在地)": "",
-                "price(価格)": "",
-                "land_area(土地面積)": "",
-                "building_area(建物面積)": "",
-                "property_url(物件詳細画面)": "",
-                "floor_plan(間取り)": "",
-                "age(築年数)": "",
-                "other_pr_points(その他PRポイント)": ""
-            },
-            "customer_info(お客様情報)": [{
-                "name(お名前)": "",
-                "furigana(フリガナ)": "",
-                "email(メールアドレス)": "",
-                "phone_number(電話番号)": "",
-                "phone_number2(電話番号2)": "",
-                "fax_number(FAX番号)": "",
-                "age(年齢)": "",
-                "postal_code(郵便番号)": "",
-                "address(ご住所)": "",
-                "monthly_rent(月々の家賃)": "",
-                "monthly_payment(月々の返済額)": "",
-                "preferred_area(希望エリア)": "",
-                "registration_reason(会員登録のきっかけ)": "",
-                "preferred_contact_method(希望連絡方法)": "",
-                "newsletter_opt_in(お知らせメール希望)": "",
-                "comments(ご意見・ご質問等)": ""
-            }],
-            "housing_preferences(希望条件情報)": {
-                "mansion_preferences(マンション希望条件情報)": {
-                    "preferred_area(希望エリア)": "",
-                    "school_district(希望校区)": "",
-                    "price_range(希望価格)": "",
-                    "floor_plan(希望間取り)": "",
-                    "exclusive_area(希望専有面積)": "",
-                    "pet_allowed(ペット可物件希望)": "",
-                    "other_conditions(その他希望条件)": ""
-                },
-                "house_preferences(一戸建て希望条件情報)": {
-                    "preferred_area(希望エリア)": "",
-                    "school_district(希望校区)": "",
-                    "price_range(希望価格)": "",
-                    "floor_plan(希望間取り)": "",
-                    "land_area(希望土地面積)": "",
-                    "building_area(希望建物面積)": "",
-                    "other_conditions(その他希望条件)": ""
-                }
-            }
-        }
+    @staticmethod
+    def get_universal_template() -> Dict[str, Any]:
+        """Returns a fresh copy of the universal JSON template structure"""
+        return pickle.loads(_UNIVERSAL_TEMPLATE_BLOB)
     
     def extract_universal_json_data(self, email_data: Dict) -> Tuple[Dict, Dict[str, ExtractedField]]:
         """Extract and map data to universal JSON format with detailed field tracking"""
         start_time = time.time()
         
-        # Get universal template
+        # Get a fresh copy of the universal template
         universal_data = self.get_universal_template()
         
         # Basic email info
@@ -878,32 +1110,17 @@ class UniversalJSONProcessor:
         email_subject = email_data.get('subject', '')
         full_text = f"{email_subject}\n{email_body}"
         
-        # Extract all fields
-        all_extracted_fields = {}
-        
-        field_names = [
-            'name', 'furigana', 'email', 'phone', 'age', 'postal_code', 
-            'address', 'inquiry_text', 'company_name', 'property_name', 
-            'price', 'url'
-        ]
+        all_extracted_fields = self._find_best_fields(full_text)
         
-        for field_name in field_names:
-            extracted_fields = self.field_extractor.extract_field(full_text, field_name)
-            if extracted_fields:
-                # Take the highest confidence field
-                best_field = max(extracted_fields, key=lambda x: x.confidence)
-                all_extracted_fields[field_name] = best_field
-                logger.info(f"Extracted {field_name}: '{best_field.value}' (confidence: {best_field.confidence:.2f})")
+        for field_name, best_field in all_extracted_fields.items():
+            logger.info("Extracted %s: '%s' (confidence: %.2f)", field_name, best_field.value, best_field.confidence)
         
         # Map extracted fields to universal JSON structure
         self.map_fields_to_universal_json(universal_data, all_extracted_fields)
         
         # Calculate processing metadata
         processing_time = int((time.time() - start_time) * 1000)
-        avg_confidence = 0.0
-        if all_extracted_fields:
-            confidences = [field.confidence for field in all_extracted_fields.values()]
-            avg_confidence = sum(confidences) / len(confidences)
+        avg_confidence = _average_confidence(all_extracted_fields)
         
         universal_data["processing_metadata"]["extraction_confidence"] = round(avg_confidence, 3)
         universal_data["processing_metadata"]["extracted_field_count"] = len(all_extracted_fields)
@@ -911,6 +1128,14 @@ class UniversalJSONProcessor:
         
         return universal_data, all_extracted_fields
     
+    def _find_best_fields(self, full_text: str) -> Dict[str, ExtractedField]:
+        """Best candidate per field found in full_text"""
+        # Every field feeds the webhook payload, so all of them are extracted
+        candidates = self.field_extractor.extract_all_fields(full_text, self.FIELD_ORDER)
+        
+        # extract_field returns candidates sorted by descending confidence, so the first is the best
+        return {field_name: extracted_fields[0] for field_name, extracted_fields in candidates.items()}
+    
     def map_fields_to_universal_json(self, universal_data: Dict, extracted_fields: Dict[str, ExtractedField]):
         """Enhanced field mapping with better error handling"""
         try:
@@ -919,46 +1144,176 @@ class UniversalJSONProcessor:
                 if not value or len(value.strip()) == 0:
                     continue
                 
-                # Customer info mappings
-                if field_name == 'name':
-                    universal_data["customer_info(お客様情報)"][0]["name(お名前)"] = value
-                elif field_name == 'furigana':
-                    universal_data["customer_info(お客様情報)"][0]["furigana(フリガナ)"] = value
-                elif field_name == 'email':
-                    universal_data["customer_info(お客様情報)"][0]["email(メールアドレス)"] = value
-                elif field_name == 'phone':
-                    universal_data["customer_info(お客様情報)"][0]["phone_number(電話番号)"] = value
-                elif field_name == 'age':
-                    if not value.endswith(("歳", "才")):
-                        value = value + "歳"
-                    universal_data["customer_info(お客様情報)"][0]["age(年齢)"] = value
-                elif field_name == 'postal_code':
-                    if not value.startswith("〒"):
-                        value = "〒" + value
-                    universal_data["customer_info(お客様情報)"][0]["postal_code(郵便番号)"] = value
-                elif field_name == 'address':
-                    universal_data["customer_info(お客様情報)"][0]["address(ご住所)"] = value
-                elif field_name == 'inquiry_text':
-                    universal_data["inquiry_info(お問い合わせ内容)"]["inquiry_text(お問い合わせ内容)"] = value
-                    universal_data["customer_info(お客様情報)"][0]["comments(ご意見・ご質問等)"] = value
-                elif field_name == 'company_name':
-                    universal_data["company_info(会社情報)"]["company_name(会社名)"] = value
-                    universal_data["property_info(物件情報)"]["company_name(会社名)"] = value
-                elif field_name == 'property_name':
-                    universal_data["property_info(物件情報)"]["property_name(物件名)"] = value
-                    universal_data["reservation_info(ご予約情報)"][0]["property_name(物件名)"] = value
-                elif field_name == 'price':
-                    universal_data["property_info(物件情報)"]["price(価格)"] = value
-                    universal_data["reservation_info(ご予約情報)"][0]["price(価格)"] = value
-                elif field_name == 'url':
-                    # Map URL to most appropriate fields
-                    universal_data["company_info(会社情報)"]["url(URL)"] = value
-                    universal_data["event_info(イベント情報)"]["event_url(URL)"] = value
-                    universal_data["property_info(物件情報)"]["property_url(物件詳細画面)"] = value
+                for path in _FIELD_MAPPING.get(field_name, ()):
+                    target = universal_data
+                    for key in path[:-1]:
+                        target = target[key]
+                    target[path[-1]] = value
                         
         except Exception as e:
             logger.error(f"Error mapping fields to universal JSON: {e}")
 
+# Partial-response mask for messages.get: only what extract_email_data reads. Subpart
+# headers and attachment metadata are left out; the innermost parts are returned whole
+# so deeper MIME nesting still comes through.
+_MESSAGE_FIELDS = (
+    'id,threadId,labelIds,snippet,internalDate,sizeEstimate,'
+    'payload(headers(name,value),mimeType,body/data,parts(mimeType,body/data,parts))'
+)
+
+# Relevance signals sit in the first few KB of a body (form fields, greeting); scanning
+# stops there so a huge promotional mail costs no more than a normal one
+_RELEVANCE_SCAN_CHARS = 16 * 1024
+
+# Relevance scoring tables, built and compiled once
+# High-value keywords (real estate, forms, inquiries)
+_HIGH_VALUE_KEYWORDS = {
+    # Customer info indicators
+    'お名前': 15, 'name': 12, '氏名': 15, '申込者': 12,
+    'メール': 12, 'email': 12, 'アドレス': 10,
+    '電話': 12, 'tel': 10, 'phone': 10, '番号': 8,
+    '住所': 12, 'address': 10, '所在地': 10,
+    
+    # Form and inquiry indicators  
+    'フォーム': 20, 'form': 18, 'お問い合わせ': 25, '問い合わせ': 20,
+    '申込': 20, '申し込み': 20, 'application': 15,
+    '予約': 15, 'reservation': 12, 'booking': 12,
+    '相談': 12, 'consultation': 10, '見学': 12,
+    
+    # Real estate keywords
+    '物件': 18, 'property': 15, '不動産': 20, 'real estate': 18,
+    '住宅': 15, 'house': 12, 'housing': 12,
+    'マンション': 15, 'mansion': 12, 'アパート': 12,
+    '戸建': 15, '一戸建て': 15,
+    
+    # Business indicators
+    '会社': 8, 'company': 8, '企業': 8, '法人': 8
+}
+
+# Medium-value keywords
+_MEDIUM_VALUE_KEYWORDS = {
+    '価格': 8, 'price': 8, '金額': 8, '料金': 8,
+    '希望': 6, '要望': 6, 'request': 6,
+    '質問': 8, 'question': 6, '回答': 6,
+    '情報': 4, 'info': 4, 'information': 4,
+    '詳細': 6, 'details': 6, '内容': 4
+}
+
+# Frozen (keyword, score) pairs for the scan loops; iterating a tuple skips the dict view
+_HIGH_VALUE_ITEMS = tuple(_HIGH_VALUE_KEYWORDS.items())
+_MEDIUM_VALUE_ITEMS = tuple(_MEDIUM_VALUE_KEYWORDS.items())
+
+# Pattern-based scoring
+_RELEVANCE_PATTERNS = [
+    (re.compile(r'[：:]\s*[^\n]'), 8),  # Colon patterns (form fields)
+    (re.compile(r'お客様情報'), 15),
+    (re.compile(r'ご質問.*[：:]'), 12),
+    (re.compile(r'申し込み.*[：:]'), 15),
+    (re.compile(r'\d+-\d+-\d+'), 10),  # Phone/postal patterns
+    (re.compile(r'@[a-zA-Z0-9.-]+\.'), 12),  # Email pattern
+    (re.compile(r'[都道府県市区町村]'), 8),  # Japanese address
+    (re.compile(r'\d+(?:万|千|億)円'), 10),  # Price patterns
+    (re.compile(r'https?://'), 6),  # URLs
+    (re.compile(r'www\.'), 4),
+]
+# Bound search methods, so the scoring loop skips an attribute lookup per pattern
+_RELEVANCE_SEARCHES = tuple((pattern.search, score) for pattern, score in _RELEVANCE_PATTERNS)
+
+# Negative indicators (reduce score)
+_NEGATIVE_KEYWORDS = (
+    'spam', 'advertisement', '広告', '宣伝', 
+    'newsletter', 'unsubscribe', '配信停止',
+    'notification', '通知', 'alert', 'アラート'
+)
+
+# Bulk-mail markers in a subject, and the strongest form/real-estate keywords that
+# override them; checked on the subject alone before any body scanning
+_BULK_SUBJECT_RE = re.compile(r'unsubscribe|newsletter|配信停止', re.IGNORECASE)
+_STRONG_SUBJECT_RE = re.compile(
+    '|'.join(re.escape(keyword) for keyword, score in _HIGH_VALUE_KEYWORDS.items() if score >= 15),
+    re.IGNORECASE
+)
+
+def _build_keyword_automaton():
+    """Aho-Corasick automaton over every relevance keyword, or None without pyahocorasick"""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    keyword_scores = {**_HIGH_VALUE_KEYWORDS, **_MEDIUM_VALUE_KEYWORDS, **dict.fromkeys(_NEGATIVE_KEYWORDS, -10)}
+    for keyword, score in keyword_scores.items():
+        automaton.add_word(keyword, (keyword, score))
+    automaton.make_automaton()
+    return automaton
+
+_KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+# Scoring is a pure function of the lowered text; the cache makes a retried message free
+@functools.lru_cache(maxsize=512)
+def _relevance_score(email_text: str) -> float:
+    """Raw relevance score of lowercased subject, body and sender text"""
+    relevance_score = 0.0
+    
+    # Check for keywords, negative ones included; each scores once however often it occurs
+    if _KEYWORD_AUTOMATON is not None:
+        seen_keywords = set()
+        for _, (keyword, score) in _KEYWORD_AUTOMATON.iter(email_text):
+            if keyword not in seen_keywords:
+                seen_keywords.add(keyword)
+                relevance_score += score
+    else:
+        contains = email_text.__contains__
+        for keyword, score in _HIGH_VALUE_ITEMS:
+            if contains(keyword):
+                relevance_score += score
+                
+        for keyword, score in _MEDIUM_VALUE_ITEMS:
+            if contains(keyword):
+                relevance_score += score
+        
+        # Negative indicators (reduce score)
+        for keyword in _NEGATIVE_KEYWORDS:
+            if contains(keyword):
+                relevance_score -= 10
+    
+    # Pattern-based scoring
+    for search, score in _RELEVANCE_SEARCHES:
+        if search(email_text):
+            relevance_score += score
+    
+    # Structural indicators
+    if email_text.count(':') + email_text.count('：') >= 3:
+        relevance_score += 10  # Multiple colon patterns suggest form data
+        
+    if email_text.count('\n') >= 5:
+        relevance_score += 5  # Multi-line content
+    
+    return relevance_score
+
+# Lowercased header name -> email_data key
+_HEADER_FIELDS = {
+    'from': 'sender',
+    'to': 'recipient',
+    'subject': 'subject',
+    'date': 'date',
+    'message-id': 'message_id',
+}
+
+# Regex fallback for HTML to text, compiled once
+_HTML_SCRIPT_STYLE_RE = re.compile(r'<(script|style)[^>]*>.*?</\1>', re.DOTALL | re.IGNORECASE)
+# Block-level tags become newlines and table cells become spaces, in a single pass
+_HTML_BREAK_RE = re.compile(r'(<td[^>]*>|</td>)|<(?:br|p|div|tr)[^>]*>|</(?:p|div|tr)>', re.IGNORECASE)
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+
+def _html_break_replacement(match: re.Match) -> str:
+    return ' ' if match.group(1) else '\n'
+
+# Bounds for the per-processor normalized body cache; longer bodies are normalized directly
+_NORMALIZE_CACHE_SIZE = 512
+_NORMALIZE_CACHE_MAX_CHARS = 8 * 1024
+
+# Any one of these extracted makes an email worth delivering
+_KEY_FIELD_SET = frozenset(UniversalJSONProcessor.KEY_FIELDS)
+
 class EnhancedGmailProcessor:
     """Enhanced Gmail API processor with improved reliability and error handling"""
     
@@ -972,12 +1327,43 @@ class EnhancedGmailProcessor:
         self.archive_processed = os.getenv('ARCHIVE_PROCESSED_EMAILS', 'true').lower() == 'true'
         self.min_confidence_threshold = float(os.getenv('MIN_CONFIDENCE_THRESHOLD', '0.3'))
         self.parallel_processing = os.getenv('PARALLEL_PROCESSING', 'false').lower() == 'true'
+        self.webhook_concurrency = max(1, int(os.getenv('WEBHOOK_CONCURRENCY', '4')))
+        # Analysis is pure-Python regex work under the GIL, so the thread pool is opt-in
+        self.analysis_workers = max(1, int(os.getenv('ANALYSIS_WORKERS', '1')))
+        self.pubsub_topic = os.getenv('GMAIL_PUBSUB_TOPIC', '')
         
         # Initialize components
         self.service = None
+        self._credentials: Optional[Credentials] = None
         self.db = EmailDatabase()
         self.json_processor = UniversalJSONProcessor()
         self._auth_lock = threading.Lock()
+        self._thread_local = threading.local()
+        
+        # Serializes every processing pass (polling, push, one-shot) so two passes never
+        # both see the same messages as unprocessed; reentrant for process_new_mail
+        self._processing_lock = threading.RLock()
+        
+        # Gmail push notification state (users.watch)
+        self._history_id = None
+        self._watch_expiration = 0.0
+        
+        # Form notifications from the same site often repeat identical bodies; normalized
+        # results are kept by body digest so the raw bodies are not held as keys
+        self._normalized_bodies: OrderedDict = OrderedDict()
+        self._normalize_lock = threading.Lock()
+        
+        # Reuse one keep-alive connection pool for all webhook requests
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.webhook_concurrency, max_retries=0)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        # Webhook headers are the same on every post, so they live on the session
+        self._session.headers.update({
+            'Content-Type': 'application/json',
+            'User-Agent': 'Enhanced-Email-Processor/2.0',
+            'X-Processor-Version': '2.0'
+        })
         
         logger.info(f"Enhanced email processor initialized:")
         logger.info(f"  - Webhook configured: {bool(self.webhook_url)}")
@@ -985,6 +1371,9 @@ class EnhancedGmailProcessor:
         logger.info(f"  - Archive processed: {self.archive_processed}")
         logger.info(f"  - Min confidence threshold: {self.min_confidence_threshold}")
         logger.info(f"  - Parallel processing: {self.parallel_processing}")
+        logger.info(f"  - Webhook concurrency: {self.webhook_concurrency}")
+        logger.info(f"  - Analysis workers: {self.analysis_workers}")
+        logger.info(f"  - Push notifications: {'Configured' if self.pubsub_topic else 'Not configured'}")
     
     def create_credentials_from_env(self) -> Optional[Credentials]:
         """Create credentials from environment variables for production deployment"""
@@ -1046,8 +1435,7 @@ class EnhancedGmailProcessor:
         # Load existing token if available
         if os.path.exists(token_path):
             try:
-                with open(token_path, 'rb') as token:
-                    creds = pickle.load(token)
+                creds = Credentials.from_authorized_user_file(token_path, self.SCOPES)
                 logger.info("Loaded existing token")
             except Exception as e:
                 logger.warning(f"Could not load existing token: {e}")
@@ -1069,8 +1457,8 @@ class EnhancedGmailProcessor:
                 creds.refresh(Request())
                 
                 # Save refreshed credentials
-                with open(token_path, 'wb') as token:
-                    pickle.dump(creds, token)
+                with open(token_path, 'w') as token:
+                    token.write(creds.to_json())
                 logger.info("Credentials refreshed and saved")
                 return creds
             except Exception as e:
@@ -1092,9 +1480,9 @@ class EnhancedGmailProcessor:
                 creds = flow.run_console()
                 logger.info("OAuth completed via console")
             
-            # Save the credentials
-            with open(token_path, 'wb') as token:
-                pickle.dump(creds, token)
+            # Save the credentials in Google's authorized-user JSON format
+            with open(token_path, 'w') as token:
+                token.write(creds.to_json())
             logger.info(f"Credentials saved to {token_path}")
             
             # Also log the refresh token for production use
@@ -1115,6 +1503,16 @@ class EnhancedGmailProcessor:
         """Authenticate with retry logic and better error handling"""
         with self._auth_lock:
             try:
+                # The built client holds a reference to these credentials, so refreshing them
+                # in place renews its token without re-running setup or rebuilding the client
+                if self.service is not None and self._credentials is not None and self._credentials.refresh_token:
+                    try:
+                        self._credentials.refresh(Request())
+                        logger.info("Refreshed Gmail API credentials")
+                        return True
+                    except Exception as e:
+                        logger.warning(f"Credential refresh failed, re-authenticating: {e}")
+                
                 creds = None
                 
                 # Try environment variables first (for production)
@@ -1134,8 +1532,12 @@ class EnhancedGmailProcessor:
                     logger.error("Failed to obtain valid credentials")
                     return False
                 
-                # Build the Gmail service
-                self.service = build('gmail', 'v1', credentials=creds)
+                # Build the Gmail service from the discovery document bundled with the client library
+                self._credentials = creds
+                self.service = build(
+                    'gmail', 'v1', credentials=creds, cache_discovery=False, static_discovery=True,
+                    requestBuilder=self._build_request
+                )
                 
                 # Test the service
                 try:
@@ -1150,33 +1552,49 @@ class EnhancedGmailProcessor:
                 logger.error(f"Authentication failed: {e}")
                 return False
     
-    def get_latest_emails(self) -> List[Dict]:
-        """Get latest unprocessed emails with better error handling"""
+    def _build_request(self, http, *args, **kwargs) -> HttpRequest:
+        """Request factory for the Gmail client that gives each thread its own connection
+        
+        httplib2 connections are not thread-safe, and the polling loop, push handler and
+        dashboard threads all share one client; each thread keeps its own keep-alive Http.
+        """
+        thread_http = getattr(self._thread_local, 'http', None)
+        if thread_http is None or thread_http.credentials is not self._credentials:
+            thread_http = google_auth_httplib2.AuthorizedHttp(self._credentials, http=build_http())
+            self._thread_local.http = thread_http
+        return HttpRequest(thread_http, *args, **kwargs)
+    
+    def get_latest_emails(self, message_ids: Optional[List[str]] = None) -> List[Dict]:
+        """Get latest unprocessed emails, or only the given message IDs when provided"""
         try:
             if not self.service:
                 if not self.authenticate():
                     return []
             
-            # Get list of emails with retry logic
-            try:
-                results = self.service.users().messages().list(
-                    userId='me',
-                    labelIds=['INBOX'],
-                    maxResults=self.max_emails * 3  # Get more to account for already processed
-                ).execute()
-            except HttpError as e:
-                if e.resp.status == 401:
-                    logger.warning("Authentication expired, re-authenticating...")
-                    if self.authenticate():
-                        results = self.service.users().messages().list(
-                            userId='me',
-                            labelIds=['INBOX'],
-                            maxResults=self.max_emails * 3
-                        ).execute()
+            if message_ids is not None:
+                # IDs already known from a push notification; no need to list the inbox
+                results = {'messages': [{'id': message_id} for message_id in message_ids]}
+            else:
+                # Get list of emails with retry logic
+                try:
+                    results = self.service.users().messages().list(
+                        userId='me',
+                        labelIds=['INBOX'],
+                        maxResults=self.max_emails * 3  # Get more to account for already processed
+                    ).execute()
+                except HttpError as e:
+                    if e.resp.status == 401:
+                        logger.warning("Authentication expired, re-authenticating...")
+                        if self.authenticate():
+                            results = self.service.users().messages().list(
+                                userId='me',
+                                labelIds=['INBOX'],
+                                maxResults=self.max_emails * 3
+                            ).execute()
+                        else:
+                            return []
                     else:
-                        return []
-                else:
-                    raise
+                        raise
             
             messages = results.get('messages', [])
             
@@ -1184,11 +1602,14 @@ class EnhancedGmailProcessor:
                 logger.info("No messages found in inbox")
                 return []
             
+            # Look up which messages were already handled with a single query
+            processed_ids = self.db.get_processed_ids([message['id'] for message in messages])
+            
             # Process emails in parallel or sequential based on config
             if self.parallel_processing:
-                emails = self._process_emails_parallel(messages)
+                emails = self._process_emails_parallel(messages, processed_ids)
             else:
-                emails = self._process_emails_sequential(messages)
+                emails = self._process_emails_sequential(messages, processed_ids)
             
             logger.info(f"Retrieved {len(emails)} new emails for processing")
             return emails
@@ -1197,7 +1618,7 @@ class EnhancedGmailProcessor:
             logger.error(f"Error getting emails: {e}")
             return []
     
-    def _process_emails_sequential(self, messages: List[Dict]) -> List[Dict]:
+    def _process_emails_sequential(self, messages: List[Dict], processed_ids: Set[str]) -> List[Dict]:
         """Process emails sequentially"""
         emails = []
         processed_count = 0
@@ -1206,7 +1627,7 @@ class EnhancedGmailProcessor:
             email_id = message['id']
             
             # Skip if already processed
-            if self.db.is_email_processed(email_id):
+            if email_id in processed_ids:
                 processed_count += 1
                 continue
             
@@ -1215,7 +1636,8 @@ class EnhancedGmailProcessor:
                 msg = self.service.users().messages().get(
                     userId='me', 
                     id=email_id,
-                    format='full'
+                    format='full',
+                    fields=_MESSAGE_FIELDS
                 ).execute()
                 
                 # Extract email data
@@ -1234,15 +1656,15 @@ class EnhancedGmailProcessor:
         logger.info(f"Processed {len(emails)} new emails ({processed_count} already processed)")
         return emails
     
-    def _process_emails_parallel(self, messages: List[Dict]) -> List[Dict]:
-        """Process emails in parallel using ThreadPoolExecutor"""
+    def _process_emails_parallel(self, messages: List[Dict], processed_ids: Set[str]) -> List[Dict]:
+        """Fetch unprocessed emails together in Gmail batch requests"""
         emails = []
         processed_count = 0
         
         # Filter out already processed emails
         unprocessed_messages = []
         for message in messages:
-            if self.db.is_email_processed(message['id']):
+            if message['id'] in processed_ids:
                 processed_count += 1
             else:
                 unprocessed_messages.append(message)
@@ -1252,38 +1674,68 @@ class EnhancedGmailProcessor:
         if not unprocessed_messages:
             return emails
         
-        # Process in parallel
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_message = {
-                executor.submit(self._fetch_single_email, message['id']): message 
-                for message in unprocessed_messages
-            }
-            
-            for future in as_completed(future_to_message):
-                try:
-                    email_data = future.result()
-                    if email_data:
-                        emails.append(email_data)
-                except Exception as e:
-                    message = future_to_message[future]
-                    logger.error(f"Error processing email {message['id']}: {e}")
+        # Fetch all of them through Gmail batch requests instead of one round-trip each
+        emails = self._fetch_emails_batch([message['id'] for message in unprocessed_messages])
         
         logger.info(f"Parallel processed {len(emails)} new emails ({processed_count} already processed)")
         return emails
     
-    def _fetch_single_email(self, email_id: str) -> Optional[Dict]:
-        """Fetch and extract single email data"""
-        try:
-            msg = self.service.users().messages().get(
-                userId='me', 
-                id=email_id,
-                format='full'
-            ).execute()
-            
-            return self.extract_email_data(msg)
-        except Exception as e:
-            logger.error(f"Error fetching email {email_id}: {e}")
-            return None
+    def _fetch_emails_batch(self, email_ids: List[str]) -> List[Dict]:
+        """Fetch and extract several emails through Gmail batch requests, keeping the given order"""
+        fetched: Dict[str, Dict] = {}
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                logger.error(f"Error fetching email {request_id}: {exception}")
+            else:
+                fetched[request_id] = response
+        
+        # The Gmail API accepts at most 100 calls per batch
+        for start in range(0, len(email_ids), 100):
+            try:
+                batch = self.service.new_batch_http_request(callback=on_response)
+                for email_id in email_ids[start:start + 100]:
+                    batch.add(
+                        self.service.users().messages().get(
+                            userId='me',
+                            id=email_id,
+                            format='full',
+                            fields=_MESSAGE_FIELDS
+                        ),
+                        request_id=email_id
+                    )
+                batch.execute()
+            except Exception as e:
+                logger.error(f"Error fetching email batch: {e}")
+        
+        emails = []
+        for email_id in email_ids:
+            msg = fetched.get(email_id)
+            if msg is None:
+                continue
+            email_data = self.extract_email_data(msg)
+            if email_data:
+                emails.append(email_data)
+        return emails
+    
+    def _normalize_body(self, body: str) -> str:
+        """normalize_text with recent results remembered by body digest"""
+        if len(body) > _NORMALIZE_CACHE_MAX_CHARS:
+            return EnhancedTextProcessor.normalize_text(body)
+        
+        key = hashlib.blake2b(body.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        with self._normalize_lock:
+            normalized = self._normalized_bodies.get(key)
+            if normalized is not None:
+                self._normalized_bodies.move_to_end(key)
+                return normalized
+        
+        normalized = EnhancedTextProcessor.normalize_text(body)
+        with self._normalize_lock:
+            self._normalized_bodies[key] = normalized
+            if len(self._normalized_bodies) > _NORMALIZE_CACHE_SIZE:
+                self._normalized_bodies.popitem(last=False)
+        return normalized
     
     def extract_email_data(self, message: Dict) -> Optional[Dict]:
         """Extract structured data from Gmail API message with better error handling"""
@@ -1303,23 +1755,19 @@ class EnhancedGmailProcessor:
             
             # Process headers
             for header in headers:
-                name = header['name'].lower()
-                value = header['value']
-                
-                if name == 'from':
-                    email_data['sender'] = value
-                elif name == 'to':
-                    email_data['recipient'] = value
-                elif name == 'subject':
-                    email_data['subject'] = value
-                elif name == 'date':
-                    email_data['date'] = value
-                elif name == 'message-id':
-                    email_data['message_id'] = value
+                key = _HEADER_FIELDS.get(header['name'].lower())
+                if key is not None:
+                    email_data[key] = header['value']
             
             # Extract body with better HTML handling
             body = self.extract_email_body(payload)
-            email_data['body'] = EnhancedTextProcessor.normalize_text(body)
+            email_data['body'] = self._normalize_body(body)
+            
+            # Lowercased once here so relevance scoring can match without IGNORECASE
+            email_data['_lower_text'] = (
+                f"{email_data.get('subject', '')} {email_data['body'][:_RELEVANCE_SCAN_CHARS]} "
+                f"{email_data.get('sender', '')}"
+            ).lower()
             
             # Convert internal date to readable format
             if email_data.get('internal_date'):
@@ -1337,37 +1785,47 @@ class EnhancedGmailProcessor:
     def extract_email_body(self, payload: Dict) -> str:
         """Enhanced email body extraction with better HTML and encoding handling"""
         try:
-            body_parts = []
-            
-            def extract_part_body(part):
-                """Recursively extract body from email parts with better handling"""
-                mime_type = part.get('mimeType', '')
+            plain_parts = []
+            html_parts = []
+            
+            # Walk the MIME tree depth-first with an explicit stack; subparts are
+            # pushed in reverse so they are visited in document order
+            stack = [payload]
+            while stack:
+                part = stack.pop()
+                subparts = part.get('parts')
+                if subparts is not None:
+                    stack.extend(reversed(subparts))
+                    continue
                 
-                if 'parts' in part:
-                    for subpart in part['parts']:
-                        extract_part_body(subpart)
-                elif mime_type == 'text/plain':
+                mime_type = part.get('mimeType', '')
+                if mime_type == 'text/plain':
                     data = part.get('body', {}).get('data', '')
                     if data:
                         try:
-                            decoded = base64.urlsafe_b64decode(data + '==').decode('utf-8', errors='ignore')
+                            decoded = _decode_base64url(data)
                             if decoded.strip():
-                                body_parts.append(decoded)
+                                plain_parts.append(decoded)
                         except Exception as e:
                             logger.debug(f"Error decoding plain text: {e}")
                 elif mime_type == 'text/html':
                     data = part.get('body', {}).get('data', '')
                     if data:
-                        try:
-                            decoded = base64.urlsafe_b64decode(data + '==').decode('utf-8', errors='ignore')
-                            # Better HTML cleaning
-                            text = self._clean_html_content(decoded)
-                            if text.strip():
-                                body_parts.append(text)
-                        except Exception as e:
-                            logger.debug(f"Error decoding HTML: {e}")
-            
-            extract_part_body(payload)
+                        html_parts.append(data)
+            
+            # Plain text is preferred; HTML alternatives are only decoded and cleaned
+            # when the message has no usable text/plain part
+            body_parts = plain_parts
+            if not body_parts:
+                for data in html_parts:
+                    try:
+                        decoded = _decode_base64url(data)
+                        # Better HTML cleaning
+                        text = self._clean_html_content(decoded)
+                        if text.strip():
+                            body_parts.append(text)
+                    except Exception as e:
+                        logger.debug(f"Error decoding HTML: {e}")
             
             # Combine all body parts with better deduplication
             full_body = self._combine_body_parts(body_parts)
@@ -1382,36 +1840,30 @@ class EnhancedGmailProcessor:
         if not html_content:
             return ""
         
+        if LexborHTMLParser is not None:
+            # Tokenize with the C-backed parser; it drops script/style and decodes entities
+            tree = LexborHTMLParser(html_content)
+            tree.strip_tags(['script', 'style'])
+            text = tree.text(separator='\n')
+        else:
+            text = self._strip_html_tags(html_content)
+        
+        # Clean up whitespace
+        return _WHITESPACE_RUN_RE.sub(_collapse_whitespace_run, text.translate(_TAB_TO_SPACE))
+    
+    def _strip_html_tags(self, html_content: str) -> str:
+        """Regex-based HTML to text fallback used when selectolax is unavailable"""
         # Remove script and style elements completely
-        html_content = re.sub(r'<(script|style)[^>]*>.*?</\1>', '', html_content, flags=re.DOTALL | re.IGNORECASE)
+        html_content = _HTML_SCRIPT_STYLE_RE.sub('', html_content)
         
         # Replace common HTML elements with meaningful text
-        replacements = [
-            (r'<br[^>]*>', '\n'),
-            (r'<p[^>]*>', '\n'),
-            (r'</p>', '\n'),
-            (r'<div[^>]*>', '\n'),
-            (r'</div>', '\n'),
-            (r'<td[^>]*>', ' '),
-            (r'</td>', ' '),
-            (r'<tr[^>]*>', '\n'),
-            (r'</tr>', '\n'),
-        ]
-        
-        for pattern, replacement in replacements:
-            html_content = re.sub(pattern, replacement, html_content, flags=re.IGNORECASE)
+        html_content = _HTML_BREAK_RE.sub(_html_break_replacement, html_content)
         
         # Remove remaining HTML tags
-        text = re.sub(r'<[^>]+>', '', html_content)
+        text = _HTML_TAG_RE.sub('', html_content)
         
         # Decode HTML entities
-        text = html.unescape(text)
-        
-        # Clean up whitespace
-        text = re.sub(r'\n\s*\n', '\n\n', text)
-        text = re.sub(r'[ \t]+', ' ', text)
-        
-        return text
+        return html.unescape(text)
     
     def _combine_body_parts(self, body_parts: List[str]) -> str:
         """Combine body parts with intelligent deduplication"""
@@ -1421,161 +1873,105 @@ class EnhancedGmailProcessor:
         if len(body_parts) == 1:
             return body_parts[0]
         
-        # Remove very similar parts (likely HTML/plain text duplicates)
+        # Remove very similar parts (likely HTML/plain text duplicates); each
+        # part's word set is computed once and kept alongside it
         unique_parts = []
+        unique_words = []
         for part in body_parts:
-            part_normalized = re.sub(r'\s+', ' ', part.lower()).strip()
+            words = frozenset(part.lower().split())
             
             is_duplicate = False
-            for existing_part in unique_parts:
-                existing_normalized = re.sub(r'\s+', ' ', existing_part.lower()).strip()
-                
-                # Check similarity ratio
-                if len(part_normalized) > 0 and len(existing_normalized) > 0:
-                    similarity = len(set(part_normalized.split()) & set(existing_normalized.split())) / max(len(set(part_normalized.split())), len(set(existing_normalized.split())))
-                    if similarity > 0.8:  # 80% similarity threshold
+            if words:
+                for existing_words in unique_words:
+                    # Check similarity ratio
+                    if existing_words and len(words & existing_words) / max(len(words), len(existing_words)) > 0.8:  # 80% similarity threshold
                         is_duplicate = True
                         break
             
             if not is_duplicate:
                 unique_parts.append(part)
+                unique_words.append(words)
         
         return '\n\n'.join(unique_parts)
     
     def check_data_relevance(self, email_data: Dict) -> Tuple[bool, float]:
-        """Enhanced relevance check with confidence scoring"""
-        subject = email_data.get('subject', '').lower()
-        body = email_data.get('body', '').lower()
-        sender = email_data.get('sender', '').lower()
-        email_text = f"{subject} {body} {sender}"
-        
-        # Enhanced relevance scoring system
-        relevance_score = 0.0
-        max_score = 100.0
-        
-        # High-value keywords (real estate, forms, inquiries)
-        high_value_keywords = {
-            # Customer info indicators
-            'お名前': 15, 'name': 12, '氏名': 15, '申込者': 12,
-            'メール': 12, 'email': 12, 'アドレス': 10,
-            '電話': 12, 'tel': 10, 'phone': 10, '番号': 8,
-            '住所': 12, 'address': 10, '所在地': 10,
-            
-            # Form and inquiry indicators  
-            'フォーム': 20, 'form': 18, 'お問い合わせ': 25, '問い合わせ': 20,
-            '申込': 20, '申し込み': 20, 'application': 15,
-            '予約': 15, 'reservation': 12, 'booking': 12,
-            '相談': 12, 'consultation': 10, '見学': 12,
-            
-            # Real estate keywords
-            '物件': 18, 'property': 15, '不動産': 20, 'real estate': 18,
-            '住宅': 15, 'house': 12, 'housing': 12,
-            'マンション': 15, 'mansion': 12, 'アパート': 12,
-            '戸建': 15, '一戸建て': 15,
-            
-            # Business indicators
-            '会社': 8, 'company': 8, '企業': 8, '法人': 8
-        }
-        
-        # Medium-value keywords
-        medium_value_keywords = {
-            '価格': 8, 'price': 8, '金額': 8, '料金': 8,
-            '希望': 6, '要望': 6, 'request': 6,
-            '質問': 8, 'question': 6, '回答': 6,
-            '情報': 4, 'info': 4, 'information': 4,
-            '詳細': 6, 'details': 6, '内容': 4
-        }
-        
-        # Check for keywords
-        for keyword, score in high_value_keywords.items():
-            if keyword in email_text:
-                relevance_score += score
-                
-        for keyword, score in medium_value_keywords.items():
-            if keyword in email_text:
-                relevance_score += score
+        """Enhanced relevance check with confidence scoring
         
-        # Pattern-based scoring
-        patterns_scores = {
-            r'[：:]\s*[^\n]': 8,  # Colon patterns (form fields)
-            r'お客様情報': 15,
-            r'ご質問.*[：:]': 12,
-            r'申し込み.*[：:]': 15,
-            r'\d+-\d+-\d+': 10,  # Phone/postal patterns
-            r'@[a-zA-Z0-9.-]+\.': 12,  # Email pattern
-            r'[都道府県市区町村]': 8,  # Japanese address
-            r'\d+(?:万|千|億)円': 10,  # Price patterns
-            r'https?://': 6,  # URLs
-            r'www\.': 4
-        }
+        A newsletter-style subject with no strong form or property keyword is rejected
+        before the body is scanned. Only the first _RELEVANCE_SCAN_CHARS characters of
+        the body are scored; the rest is checked for negative keywords only when the
+        email would otherwise be relevant.
+        """
+        subject = email_data.get('subject', '')
+        if _BULK_SUBJECT_RE.search(subject) and not _STRONG_SUBJECT_RE.search(subject):
+            logger.info("Relevance check: bulk-mail subject, skipped scoring")
+            return False, 0.0
         
-        for pattern, score in patterns_scores.items():
-            if re.search(pattern, email_text, re.IGNORECASE):
-                relevance_score += score
+        email_text = email_data.get('_lower_text')
+        if email_text is None:
+            # Joined first and lowered in one pass
+            body = email_data.get('body', '')[:_RELEVANCE_SCAN_CHARS]
+            email_text = f"{subject} {body} {email_data.get('sender', '')}".lower()
         
-        # Structural indicators
-        if len(re.findall(r'[：:]', email_text)) >= 3:
-            relevance_score += 10  # Multiple colon patterns suggest form data
-            
-        if len(re.findall(r'\n', email_text)) >= 5:
-            relevance_score += 5  # Multi-line content
+        # Enhanced relevance scoring system
+        relevance_score = _relevance_score(email_text)
+        max_score = 100.0
         
-        # Negative indicators (reduce score)
-        negative_keywords = [
-            'spam', 'advertisement', '広告', '宣伝', 
-            'newsletter', 'unsubscribe', '配信停止',
-            'notification', '通知', 'alert', 'アラート'
-        ]
-        
-        for keyword in negative_keywords:
-            if keyword in email_text:
-                relevance_score -= 10
+        # Unsubscribe footers sit at the end of long mails; look past the cap before accepting
+        body = email_data.get('body', '')
+        if len(body) > _RELEVANCE_SCAN_CHARS and relevance_score / max_score >= 0.3:
+            tail = body[_RELEVANCE_SCAN_CHARS:].lower()
+            for keyword in _NEGATIVE_KEYWORDS:
+                if keyword in tail and keyword not in email_text:
+                    relevance_score -= 10
         
         # Normalize score
         confidence = min(1.0, relevance_score / max_score)
         is_relevant = confidence >= 0.3  # 30% threshold
         
-        logger.info(f"Relevance check: score={relevance_score:.1f}, confidence={confidence:.2f}, relevant={is_relevant}")
+        logger.info("Relevance check: score=%.1f, confidence=%.2f, relevant=%s", relevance_score, confidence, is_relevant)
         return is_relevant, confidence
     
     @backoff.on_exception(backoff.expo, requests.exceptions.RequestException, max_tries=3)
-    def send_to_webhook(self, data: Dict, email_id: str = None) -> bool:
-        """Enhanced webhook sending with retry logic and better error handling"""
+    def send_to_webhook(self, data: Dict, email_id: str = None, data_json: Optional[bytes] = None,
+                        timestamp: Optional[str] = None) -> bool:
+        """Enhanced webhook sending with retry logic and better error handling
+        
+        data_json, when given, is data already serialized to JSON and is used as is.
+        timestamp lets a batch stamp all of its payloads with one ISO time.
+        """
         if not self.webhook_url:
             logger.warning("No webhook URL configured, skipping webhook send")
             return False
         
         try:
-            # Add metadata to webhook payload
-            webhook_payload = {
-                'email_id': email_id,
-                'timestamp': datetime.now().isoformat(),
-                'processor_version': '2.0',
-                'data': data
-            }
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'User-Agent': 'Enhanced-Email-Processor/2.0',
-                'X-Processor-Version': '2.0'
-            }
-            
-            response = requests.post(
+            if data_json is None:
+                data_json = _json_bytes(data)
+            if timestamp is None:
+                timestamp = datetime.now().isoformat()
+            
+            # Add metadata to webhook payload; the data bytes are spliced in rather than re-encoded
+            webhook_payload = b''.join((
+                b'{"email_id":', _json_bytes(email_id),
+                b',"timestamp":', _json_bytes(timestamp),
+                b',"processor_version":"2.0","data":', data_json, b'}'
+            ))
+            
+            response = self._session.post(
                 self.webhook_url,
-                json=webhook_payload,
-                headers=headers,
+                data=webhook_payload,
                 timeout=30
             )
             
             if response.status_code in [200, 201, 202, 204]:
-                logger.info(f"Data successfully sent to webhook for email {email_id}")
+                logger.info("Data successfully sent to webhook for email %s", email_id)
                 return True
             else:
-                logger.warning(f"Webhook returned status {response.status_code} for email {email_id}: {response.text[:200]}")
+                logger.warning("Webhook returned status %s for email %s: %s", response.status_code, email_id, response.text[:200])
                 return False
                 
         except Exception as e:
-            logger.error(f"Error sending to webhook for email {email_id}: {e}")
+            logger.error("Error sending to webhook for email %s: %s", email_id, e)
             return False
     
     def archive_email(self, email_id: str) -> bool:
@@ -1593,16 +1989,40 @@ class EnhancedGmailProcessor:
                 }
             ).execute()
             
-            logger.debug(f"Archived email {email_id}")
+            logger.debug("Archived email %s", email_id)
             return True
             
         except Exception as e:
-            logger.error(f"Failed to archive email {email_id}: {e}")
+            logger.error("Failed to archive email %s: %s", email_id, e)
             return False
     
-    def process_single_email(self, email_data: Dict) -> ProcessingResult:
-        """Process a single email and return detailed results"""
-        start_time = time.time()
+    def archive_emails(self, email_ids: List[str]) -> Set[str]:
+        """Archive several emails with Gmail batchModify calls; returns the IDs that were archived"""
+        if not self.archive_processed:
+            return set(email_ids)  # Skip archiving if disabled
+        
+        archived = set()
+        
+        # batchModify relabels up to 1000 messages in one call and succeeds or fails as a whole
+        for start in range(0, len(email_ids), 1000):
+            chunk = email_ids[start:start + 1000]
+            try:
+                self.service.users().messages().batchModify(
+                    userId='me',
+                    body={
+                        'ids': chunk,
+                        'removeLabelIds': ['INBOX']
+                    }
+                ).execute()
+                archived.update(chunk)
+                logger.debug("Archived %d emails", len(chunk))
+            except Exception as e:
+                logger.error("Failed to archive %d emails: %s", len(chunk), e)
+        
+        return archived
+    
+    def _analyze_email(self, email_data: Dict) -> Tuple[ProcessingResult, bool]:
+        """Run relevance check and extraction; the flag tells whether the result should be delivered"""
         email_id = email_data.get('id', 'unknown')
         
         result = ProcessingResult(
@@ -1614,86 +2034,120 @@ class EnhancedGmailProcessor:
             subject = email_data.get('subject', 'No Subject')
             sender = email_data.get('sender', 'Unknown Sender')
             
-            logger.info(f"Processing email {email_id}: '{subject}' from {sender}")
+            logger.info("Processing email %s: '%s' from %s", email_id, subject, sender)
             
             # Check relevance first
             is_relevant, relevance_confidence = self.check_data_relevance(email_data)
             
             if not is_relevant:
-                logger.info(f"Email {email_id} - Not relevant (confidence: {relevance_confidence:.2f})")
+                logger.info("Email %s - Not relevant (confidence: %.2f)", email_id, relevance_confidence)
                 result.success = True
                 result.error_message = f"Low relevance (confidence: {relevance_confidence:.2f})"
-                return result
+                return result, False
             
             # Extract universal JSON data
             universal_data, extracted_fields = self.json_processor.extract_universal_json_data(email_data)
             
-            # Calculate overall extraction confidence
-            if extracted_fields:
-                confidences = [field.confidence for field in extracted_fields.values()]
-                avg_confidence = sum(confidences) / len(confidences)
-            else:
-                avg_confidence = 0.0
-            
-            # Check if we extracted meaningful data
-            has_meaningful_data = (
-                avg_confidence >= self.min_confidence_threshold and
-                len(extracted_fields) >= 2  # At least 2 fields extracted
-            )
-            
-            key_fields = ['name', 'email', 'phone', 'inquiry_text']
-            has_key_field = any(field in extracted_fields for field in key_fields)
-            
-            if not has_meaningful_data and not has_key_field:
-                logger.info(f"Email {email_id} - Insufficient meaningful data (confidence: {avg_confidence:.2f}, fields: {len(extracted_fields)})")
-                result.success = True
-                result.universal_data = universal_data
-                result.extracted_fields = extracted_fields
-                result.error_message = f"Insufficient data quality (confidence: {avg_confidence:.2f})"
-                return result
-            
-            # Send to webhook if configured
-            webhook_success = False
-            if self.webhook_url:
-                webhook_success = self.send_to_webhook(universal_data, email_id)
-                result.webhook_sent = webhook_success
-                
-                if webhook_success:
-                    logger.info(f"Successfully processed and sent webhook for email {email_id}")
-                else:
-                    logger.error(f"Failed to send webhook for email {email_id}")
-            else:
-                logger.info(f"Successfully processed email {email_id} (no webhook configured)")
-                result.webhook_sent = True  # Consider success if no webhook needed
-            
-            # Archive email if configured and successful
-            if result.webhook_sent and self.archive_email(email_id):
-                result.archived = True
-            
-            # Mark as successful
             result.success = True
             result.universal_data = universal_data
+            # Serialized once here in template order; the webhook body and the database row reuse these bytes
+            result.universal_json = _json_bytes(universal_data)
             result.extracted_fields = extracted_fields
             
-            processing_time = int((time.time() - start_time) * 1000)
-            logger.info(f"Email {email_id} processed successfully in {processing_time}ms (confidence: {avg_confidence:.2f})")
+            # A key field qualifies the email on its own; the average is only needed without one
+            has_key_field = not _KEY_FIELD_SET.isdisjoint(extracted_fields)
             
-            return result
+            if not has_key_field:
+                # Calculate overall extraction confidence
+                avg_confidence = _average_confidence(extracted_fields)
+                
+                # Check if we extracted meaningful data
+                has_meaningful_data = (
+                    avg_confidence >= self.min_confidence_threshold and
+                    len(extracted_fields) >= 2  # At least 2 fields extracted
+                )
+                
+                if not has_meaningful_data:
+                    logger.info("Email %s - Insufficient meaningful data (confidence: %.2f, fields: %d)",
+                                email_id, avg_confidence, len(extracted_fields))
+                    result.error_message = f"Insufficient data quality (confidence: {avg_confidence:.2f})"
+                    return result, False
+            
+            return result, True
             
         except Exception as e:
             error_msg = f"Error processing email {email_id}: {e}"
             logger.error(error_msg)
             result.error_message = str(e)
+            return result, False
+    
+    def _send_result_webhook(self, result: ProcessingResult, timestamp: Optional[str] = None):
+        """Send the extracted data of a result to the webhook and record the outcome"""
+        if self.webhook_url:
+            webhook_success = self.send_to_webhook(result.universal_data, result.email_id,
+                                                   data_json=result.universal_json or None,
+                                                   timestamp=timestamp)
+            result.webhook_sent = webhook_success
+            
+            if webhook_success:
+                logger.info("Successfully processed and sent webhook for email %s", result.email_id)
+            else:
+                logger.error("Failed to send webhook for email %s", result.email_id)
+        else:
+            logger.info("Successfully processed email %s (no webhook configured)", result.email_id)
+            result.webhook_sent = True  # Consider success if no webhook needed
+    
+    def _dispatch_webhooks(self, results: List[ProcessingResult]):
+        """Send webhooks for several results with bounded concurrency over the shared session"""
+        if not results:
+            return
+        
+        # The whole batch is stamped with one time instead of one clock read per post
+        send = functools.partial(self._send_result_webhook, timestamp=datetime.now().isoformat())
+        
+        if len(results) == 1 or self.webhook_concurrency <= 1:
+            for result in results:
+                send(result)
+            return
+        
+        # Webhook posts are network-bound, so overlap them instead of waiting on each in turn
+        with ThreadPoolExecutor(max_workers=min(self.webhook_concurrency, len(results))) as executor:
+            list(executor.map(send, results))
+    
+    def process_single_email(self, email_data: Dict) -> ProcessingResult:
+        """Process a single email and return detailed results"""
+        start_time = time.time()
+        
+        result, deliverable = self._analyze_email(email_data)
+        if not deliverable:
             return result
+        
+        # Send to webhook if configured
+        self._send_result_webhook(result)
+        
+        # Archive email if configured and successful
+        if result.webhook_sent and self.archive_email(result.email_id):
+            result.archived = True
+        
+        processing_time = int((time.time() - start_time) * 1000)
+        logger.info("Email %s processed successfully in %dms (confidence: %.2f)", result.email_id, processing_time,
+                    result.universal_data['processing_metadata']['extraction_confidence'])
+        
+        return result
     
-    def process_emails(self) -> Dict:
+    def process_emails(self, message_ids: Optional[List[str]] = None) -> Dict:
         """Enhanced main processing function with better error handling and metrics"""
+        with self._processing_lock:
+            return self._process_emails(message_ids)
+    
+    def _process_emails(self, message_ids: Optional[List[str]] = None) -> Dict:
+        """Run one processing pass; callers hold _processing_lock"""
         try:
             # Clean up old database connections
             self.db.cleanup_old_connections()
             
             # Get latest unprocessed emails
-            emails = self.get_latest_emails()
+            emails = self.get_latest_emails(message_ids)
             
             if not emails:
                 logger.info("No new emails to process")
@@ -1708,18 +2162,32 @@ class EnhancedGmailProcessor:
             
             # Process emails
             results = []
+            pending_delivery = []
             total_start_time = time.time()
             
-            for email_data in emails:
-                result = self.process_single_email(email_data)
-                
-                # Update result with email metadata
-                result.email_id = email_data.get('id', 'unknown')
-                
+            # Relevance scoring and field extraction are independent per email
+            if self.analysis_workers > 1 and len(emails) > 1:
+                with ThreadPoolExecutor(max_workers=min(self.analysis_workers, len(emails))) as executor:
+                    analyzed = list(executor.map(self._analyze_email, emails))
+            else:
+                analyzed = [self._analyze_email(email_data) for email_data in emails]
+            
+            for result, deliverable in analyzed:
+                results.append(result)
+                if deliverable:
+                    pending_delivery.append(result)
+            
+            # Deliver webhooks concurrently, then archive the delivered emails in one batch
+            self._dispatch_webhooks(pending_delivery)
+            delivered = [result for result in pending_delivery if result.webhook_sent]
+            if delivered:
+                archived_ids = self.archive_emails([result.email_id for result in delivered])
+                for result in delivered:
+                    result.archived = result.email_id in archived_ids
+            
+            for result in results:
                 # Store in database
                 self.db.mark_email_processed(result)
-                
-                results.append(result)
             
             total_processing_time = int((time.time() - total_start_time) * 1000)
             
@@ -1729,15 +2197,14 @@ class EnhancedGmailProcessor:
             failed_webhooks = processed_count - successful_webhooks
             archived_count = sum(1 for r in results if r.archived)
             
-            # Calculate average confidence
-            confidences = []
+            # Calculate average confidence, as a running total over results with fields
+            confidence_total = 0.0
+            confidence_count = 0
             for result in results:
                 if result.extracted_fields:
-                    field_confidences = [field.confidence for field in result.extracted_fields.values()]
-                    if field_confidences:
-                        confidences.append(sum(field_confidences) / len(field_confidences))
-            
-            avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+                    confidence_total += _average_confidence(result.extracted_fields)
+                    confidence_count += 1
+            avg_confidence = confidence_total / confidence_count if confidence_count else 0.0
             
             # Update statistics
             self.db.update_daily_stats(processed_count, successful_webhooks, failed_webhooks)
@@ -1776,6 +2243,119 @@ class EnhancedGmailProcessor:
             logger.error(f"Error in run_once: {e}")
             return {'processed': 0, 'error': str(e)}
     
+    def start_watch(self) -> bool:
+        """Register (or renew) a Gmail push notification watch on the inbox"""
+        if not self.pubsub_topic:
+            return False
+        
+        try:
+            if not self.service:
+                if not self.authenticate():
+                    return False
+            
+            response = self.service.users().watch(
+                userId='me',
+                body={
+                    'topicName': self.pubsub_topic,
+                    'labelIds': ['INBOX'],
+                    'labelFilterBehavior': 'INCLUDE'
+                }
+            ).execute()
+            
+            # Keep an existing cursor on renewal so no history is skipped
+            if self._history_id is None:
+                self._history_id = str(response['historyId'])
+            self._watch_expiration = int(response.get('expiration', 0)) / 1000
+            
+            logger.info(f"Gmail watch registered on {self.pubsub_topic} (history ID {response['historyId']})")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to register Gmail watch: {e}")
+            return False
+    
+    def ensure_watch(self) -> bool:
+        """Renew the Gmail watch when it is within a day of expiring (watches last 7 days)"""
+        if not self.pubsub_topic:
+            return False
+        if time.time() < self._watch_expiration - 86400:
+            return True
+        return self.start_watch()
+    
+    def watch_active(self) -> bool:
+        """Whether a registered Gmail watch is currently delivering push notifications"""
+        return bool(self.pubsub_topic) and time.time() < self._watch_expiration
+    
+    def get_new_message_ids(self) -> Optional[Tuple[List[str], str]]:
+        """List inbox messages added since the last seen history ID, with the history ID to resume from
+        
+        Returns None when a full scan is needed. The cursor itself is not moved; the caller
+        commits the returned history ID once the messages were processed.
+        """
+        if self._history_id is None:
+            return None
+        
+        message_ids = {}
+        latest_history_id = self._history_id
+        
+        try:
+            request = self.service.users().history().list(
+                userId='me',
+                startHistoryId=self._history_id,
+                historyTypes=['messageAdded'],
+                labelId='INBOX'
+            )
+            while request is not None:
+                response = request.execute()
+                for record in response.get('history', []):
+                    for added in record.get('messagesAdded', []):
+                        message_ids[added['message']['id']] = None
+                latest_history_id = str(response.get('historyId', latest_history_id))
+                request = self.service.users().history().list_next(request, response)
+                
+        except HttpError as e:
+            if e.resp.status == 404:
+                # The stored history ID is too old; Gmail only keeps about a week
+                logger.warning("Gmail history ID expired, falling back to a full inbox scan")
+                self._history_id = None
+                return None
+            raise
+        
+        return list(message_ids), latest_history_id
+    
+    def process_new_mail(self, history_id: Optional[str] = None, full_scan: bool = False) -> Dict:
+        """Process mail announced by a Gmail push notification
+        
+        Only messages added since the last seen history ID are fetched. Without a usable
+        history cursor, or with full_scan, the inbox is listed as in polling mode.
+        """
+        with self._processing_lock:
+            if not self.service:
+                if not self.authenticate():
+                    return {'processed': 0, 'error': 'Authentication failed'}
+            
+            message_ids = None
+            new_history_id = None
+            if not full_scan:
+                try:
+                    history = self.get_new_message_ids()
+                except Exception as e:
+                    logger.error(f"Error reading Gmail history: {e}")
+                    history = None
+                if history is not None:
+                    message_ids, new_history_id = history
+            
+            results = self.process_emails(message_ids)
+            
+            # Advance the cursor only after a clean pass, so a failed one is listed again next time
+            if 'error' not in results:
+                if new_history_id is not None:
+                    self._history_id = new_history_id
+                elif self._history_id is None and history_id:
+                    self._history_id = str(history_id)
+            
+            return results
+    
     def get_stats(self) -> Dict:
         """Get comprehensive processing statistics"""
         return self.db.get_stats()
@@ -1824,7 +2404,7 @@ class EnhancedGmailProcessor:
             if self.webhook_url:
                 try:
                     # Send a test ping (without actual data)
-                    response = requests.head(self.webhook_url, timeout=10)
+                    response = self._session.head(self.webhook_url, timeout=10)
                     if response.status_code < 500:
                         health['components']['webhook'] = {'status': 'healthy', 'url_accessible': True}
                     else:
@@ -1842,6 +2422,78 @@ class EnhancedGmailProcessor:
         return health
 
 
+def _cmd_setup_oauth(args):
+    """Set up OAuth credentials"""
+    processor = EnhancedGmailProcessor(webhook_url=args.webhook)
+    logger.info("Setting up OAuth credentials...")
+    if processor.authenticate():
+        logger.info("OAuth setup completed successfully!")
+        logger.info("You can now run the processor normally.")
+    else:
+        logger.error("OAuth setup failed!")
+
+def _cmd_clear_data(args):
+    """Clear all processed email data after confirmation"""
+    logger.warning("This will delete ALL processed email data!")
+    confirm = input("Type 'YES' to confirm: ")
+    if confirm == 'YES':
+        processor = EnhancedGmailProcessor(webhook_url=args.webhook)
+        if processor.clear_processed_data():
+            logger.info("All processed email data cleared successfully")
+        else:
+            logger.error("Failed to clear data")
+    else:
+        logger.info("Data clearing cancelled")
+
+def _cmd_health_check(args):
+    """Print a health check and exit non-zero when unhealthy"""
+    processor = EnhancedGmailProcessor(webhook_url=args.webhook)
+    health = processor.health_check()
+    print(f"\n=== System Health Check ===")
+    print(f"Overall Status: {health['overall_status'].upper()}")
+    print(f"Timestamp: {health['timestamp']}")
+    
+    for component, status in health['components'].items():
+        print(f"\n{component.replace('_', ' ').title()}:")
+        for key, value in status.items():
+            print(f"  {key}: {value}")
+    
+    if health['overall_status'] != 'healthy':
+        exit(1)
+
+def _cmd_stats(args):
+    """Print processing statistics"""
+    # Statistics only read the database; no Gmail or webhook setup is needed
+    db = EmailDatabase()
+    stats = db.get_stats()
+    recent_emails = db.get_recent_processed_emails()
+    
+    print("\n=== Enhanced Email Processor Statistics ===")
+    print(f"Total processed: {stats.get('total_processed', 0)}")
+    print(f"Successful webhooks: {stats.get('successful_webhooks', 0)}")
+    print(f"Failed webhooks: {stats.get('failed_webhooks', 0)}")
+    print(f"Average confidence: {stats.get('average_confidence', 0.0):.3f}")
+    print(f"Today processed: {stats.get('today_processed', 0)}")
+    print(f"Today successful: {stats.get('today_successful', 0)}")
+    
+    if stats.get('field_extraction_stats'):
+        print("\n=== Field Extraction Statistics ===")
+        for field_stat in stats['field_extraction_stats'][:5]:
+            print(f"  {field_stat['field']}: {field_stat['count']} times (avg confidence: {field_stat['avg_confidence']:.3f})")
+    
+    if recent_emails:
+        print("\n=== Recent Processed Emails ===")
+        for email in recent_emails[:5]:
+            print(f"  - {email['subject']} from {email['sender']} ({email['processed_date']})")
+
+# CLI flag -> one-shot command, checked in this order
+_CLI_COMMANDS = (
+    ('setup_oauth', _cmd_setup_oauth),
+    ('clear_data', _cmd_clear_data),
+    ('health_check', _cmd_health_check),
+    ('stats', _cmd_stats),
+)
+
 def main():
     """Enhanced main function with better CLI and error handling"""
     import argparse
@@ -1878,77 +2530,18 @@ Examples:
     
     args = parser.parse_args()
     
-    # Initialize processor
     try:
         # Set environment variable if provided
         if args.min_confidence:
             os.environ['MIN_CONFIDENCE_THRESHOLD'] = str(args.min_confidence)
         
-        processor = EnhancedGmailProcessor(webhook_url=args.webhook)
-        
-        # Set up OAuth if requested
-        if args.setup_oauth:
-            logger.info("Setting up OAuth credentials...")
-            if processor.authenticate():
-                logger.info("OAuth setup completed successfully!")
-                logger.info("You can now run the processor normally.")
-            else:
-                logger.error("OAuth setup failed!")
-            return
-        
-        # Clear data if requested
-        if args.clear_data:
-            logger.warning("This will delete ALL processed email data!")
-            confirm = input("Type 'YES' to confirm: ")
-            if confirm == 'YES':
-                if processor.clear_processed_data():
-                    logger.info("All processed email data cleared successfully")
-                else:
-                    logger.error("Failed to clear data")
-            else:
-                logger.info("Data clearing cancelled")
-            return
-        
-        # Health check if requested
-        if args.health_check:
-            health = processor.health_check()
-            print(f"\n=== System Health Check ===")
-            print(f"Overall Status: {health['overall_status'].upper()}")
-            print(f"Timestamp: {health['timestamp']}")
-            
-            for component, status in health['components'].items():
-                print(f"\n{component.replace('_', ' ').title()}:")
-                for key, value in status.items():
-                    print(f"  {key}: {value}")
-            
-            if health['overall_status'] != 'healthy':
-                exit(1)
-            return
-        
-        # Show stats if requested
-        if args.stats:
-            stats = processor.get_stats()
-            recent_emails = processor.get_recent_emails()
-            
-            print("\n=== Enhanced Email Processor Statistics ===")
-            print(f"Total processed: {stats.get('total_processed', 0)}")
-            print(f"Successful webhooks: {stats.get('successful_webhooks', 0)}")
-            print(f"Failed webhooks: {stats.get('failed_webhooks', 0)}")
-            print(f"Average confidence: {stats.get('average_confidence', 0.0):.3f}")
-            print(f"Today processed: {stats.get('today_processed', 0)}")
-            print(f"Today successful: {stats.get('today_successful', 0)}")
-            
-            if stats.get('field_extraction_stats'):
-                print("\n=== Field Extraction Statistics ===")
-                for field_stat in stats['field_extraction_stats'][:5]:
-                    print(f"  {field_stat['field']}: {field_stat['count']} times (avg confidence: {field_stat['avg_confidence']:.3f})")
-            
-            if recent_emails:
-                print("\n=== Recent Processed Emails ===")
-                for email in recent_emails[:5]:
-                    print(f"  - {email['subject']} from {email['sender']} ({email['processed_date']})")
-            return
+        # One-shot commands build only what they use; the first flag given wins
+        for flag, command in _CLI_COMMANDS:
+            if getattr(args, flag):
+                command(args)
+                return
         
+        processor = EnhancedGmailProcessor(webhook_url=args.webhook)
         logger.info("Enhanced email processor initialized successfully")
         
         if args.once:
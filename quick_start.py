@@ -6,19 +6,43 @@ Run this to get started quickly with the email processor system
 
 import os
 import sys
-import subprocess
-import json
+
+# packaging parses requirement specifiers; without it pip always checks requirements.txt itself
+try:
+    from packaging.requirements import Requirement, InvalidRequirement
+except ImportError:
+    Requirement = None
+
+# orjson writes the config straight to UTF-8 bytes in native code; stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SETUP_STATE_PATH = '.quickstart_state.json'
+PIP_MARKER_PATH = '.pip_installed'
+_PY_OK = sys.version_info >= (3, 8)
+WEBHOOK_URL = 'https://y8xp2r4oy7i.jp.larksuite.com/base/automation/webhook/event/DuuGaDaKVw5FCFhFKogjybwepic'
+
+# Authenticated processor from test_gmail_auth, reused by the quick test runs
+_shared_processor = None
+
+def bprint(*lines):
+    """Write several lines to stdout in a single call"""
+    sys.stdout.write('\n'.join(lines) + '\n')
 
 def print_header():
-    print("=" * 70)
-    print("🚀 Enhanced Email Processor - Quick Start")
-    print("=" * 70)
-    print("This script will help you set up and test the email processor system.")
-    print()
+    bprint(
+        "=" * 70,
+        "🚀 Enhanced Email Processor - Quick Start",
+        "=" * 70,
+        "This script will help you set up and test the email processor system.",
+        ""
+    )
 
 def check_python_version():
     """Check if Python version is adequate"""
-    if sys.version_info < (3, 8):
+    if not _PY_OK:
         print("❌ Python 3.8 or higher is required.")
         print(f"   Current version: {sys.version}")
         return False
@@ -35,9 +59,13 @@ def check_files():
         'requirements.txt': 'Python package requirements'
     }
     
+    # One directory listing answers every lookup instead of a stat per file
+    with os.scandir('.') as entries:
+        present = {entry.name for entry in entries}
+
     missing_files = []
     for file, description in required_files.items():
-        if os.path.exists(file):
+        if file in present:
             print(f"✅ Found: {file}")
         else:
             print(f"❌ Missing: {file} ({description})")
@@ -45,23 +73,135 @@ def check_files():
     
     return len(missing_files) == 0
 
+def _missing_requirements(path='requirements.txt'):
+    """List requirements the installed packages do not satisfy, or None when that cannot be told"""
+    if Requirement is None:
+        return None
+    from importlib import metadata
+
+    missing = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                if line.startswith('-'):
+                    return None  # pip options such as -r or -e need pip itself
+                req = Requirement(line)
+                if req.marker is not None and not req.marker.evaluate():
+                    continue
+                try:
+                    installed = metadata.version(req.name)
+                except metadata.PackageNotFoundError:
+                    missing.append(line)
+                    continue
+                if not req.specifier.contains(installed, prereleases=True):
+                    missing.append(line)
+    except (OSError, InvalidRequirement):
+        return None
+    return missing
+
+def _requirements_hash(path='requirements.txt'):
+    """SHA-256 of the requirements file contents, or None if it cannot be read"""
+    import hashlib
+
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def _read_pip_marker():
+    """Requirements hash recorded by the last successful install"""
+    try:
+        with open(PIP_MARKER_PATH, encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _write_pip_marker(requirements_hash):
+    """Record the requirements hash a successful install was made for"""
+    if requirements_hash is None:
+        return
+    try:
+        with open(PIP_MARKER_PATH, 'w', encoding='utf-8') as f:
+            f.write(requirements_hash)
+    except OSError:
+        pass
+
 def install_dependencies():
     """Install Python dependencies"""
+    import subprocess
+
     print("\n📦 Installing Python dependencies...")
+    # Keyed on content, so touching requirements.txt alone does not trigger a reinstall
+    requirements_hash = _requirements_hash()
+    if requirements_hash is not None and _read_pip_marker() == requirements_hash:
+        print("✅ Dependencies already installed for this requirements.txt")
+        return True
+    
+    missing = _missing_requirements()
+    if missing == []:
+        print("✅ All dependencies already installed")
+        _write_pip_marker(requirements_hash)
+        return True
+    # Install only what is missing when known, otherwise let pip work through the whole file
+    packages = missing if missing else ["-r", "requirements.txt"]
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
+        subprocess.check_call([sys.executable, "-m", "pip", "install", *packages])
         print("✅ Dependencies installed successfully")
+        _write_pip_marker(requirements_hash)
         return True
     except subprocess.CalledProcessError as e:
         print(f"❌ Failed to install dependencies: {e}")
         return False
 
+def _setup_fingerprint():
+    """Fingerprint of the inputs the file and dependency checks depend on"""
+    try:
+        return {
+            'py': list(sys.version_info[:2]),
+            'req_mtime': os.stat('requirements.txt').st_mtime_ns,
+            'creds_mtime': os.stat('credentials.json').st_mtime_ns
+        }
+    except OSError:
+        return None
+
+def setup_already_validated():
+    """Check whether the last successful setup ran against the same inputs"""
+    import json
+
+    fingerprint = _setup_fingerprint()
+    if fingerprint is None:
+        return False
+    try:
+        with open(SETUP_STATE_PATH, encoding='utf-8') as f:
+            return json.load(f) == fingerprint
+    except (OSError, ValueError):
+        return False
+
+def save_setup_state():
+    """Record the inputs of a successful setup so the next launch can skip it"""
+    import json
+
+    fingerprint = _setup_fingerprint()
+    if fingerprint is None:
+        return
+    try:
+        with open(SETUP_STATE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(fingerprint, f)
+    except OSError:
+        pass
+
 def create_initial_config():
     """Create initial configuration file"""
+    import json
+
     config = {
         "credentials_path": "credentials.json",
         "token_path": "token.json",
-        "webhook_url": "https://y8xp2r4oy7i.jp.larksuite.com/base/automation/webhook/event/DuuGaDaKVw5FCFhFKogjybwepic",
+        "webhook_url": WEBHOOK_URL,
         "check_interval": 20,
         "max_emails": 10,
         "log_level": "INFO",
@@ -70,8 +210,12 @@ def create_initial_config():
     }
     
     try:
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            with open('config.json', 'wb') as f:
+                f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
+        else:
+            with open('config.json', 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=2, ensure_ascii=False)
         print("✅ Created initial configuration file (config.json)")
         return True
     except Exception as e:
@@ -80,18 +224,16 @@ def create_initial_config():
 
 def test_gmail_auth():
     """Test Gmail API authentication"""
+    global _shared_processor
     print("\n🔐 Testing Gmail API authentication...")
     try:
-        from email_processor import GmailAPIProcessor
+        from email_processor import EnhancedGmailProcessor
         
-        processor = GmailAPIProcessor(
-            credentials_path='credentials.json',
-            token_path='token.json', 
-            webhook_url='dummy_url'
-        )
+        processor = EnhancedGmailProcessor(webhook_url=WEBHOOK_URL)
         
         if processor.authenticate():
             print("✅ Gmail API authentication successful!")
+            _shared_processor = processor
             return True
         else:
             print("❌ Gmail API authentication failed")
@@ -106,19 +248,22 @@ def test_gmail_auth():
         print(f"❌ Authentication error: {e}")
         return False
 
-def run_quick_test():
+def run_quick_test(processor=None):
     """Run a quick test of the email processor"""
     print("\n🧪 Running quick test...")
     try:
-        from email_processor import GmailAPIProcessor
+        processor = processor or _shared_processor
+        if processor is None:
+            from email_processor import EnhancedGmailProcessor
+            
+            processor = EnhancedGmailProcessor(webhook_url=WEBHOOK_URL)
         
-        processor = GmailAPIProcessor(
-            credentials_path='credentials.json',
-            token_path='token.json',
-            webhook_url='https://y8xp2r4oy7i.jp.larksuite.com/base/automation/webhook/event/DuuGaDaKVw5FCFhFKogjybwepic'
-        )
+        results = processor.run_once()
+        if 'error' in results:
+            print(f"❌ Test failed: {results['error']}")
+            return False
         
-        processed = processor.run_once()
+        processed = results['processed']
         print(f"✅ Quick test completed! Processed {processed} emails.")
         
         if processed > 0:
@@ -135,12 +280,14 @@ def run_quick_test():
 
 def start_dashboard():
     """Start the web dashboard"""
-    print("\n🌐 Starting web dashboard...")
-    print("📊 Dashboard will be available at: http://localhost:5000")
-    print("🎮 Use the dashboard to control and monitor the email processor")
-    print()
-    print("Press Ctrl+C to stop the application")
-    print("=" * 70)
+    bprint(
+        "\n🌐 Starting web dashboard...",
+        "📊 Dashboard will be available at: http://localhost:5000",
+        "🎮 Use the dashboard to control and monitor the email processor",
+        "",
+        "Press Ctrl+C to stop the application",
+        "=" * 70
+    )
     
     try:
         # Import and run the Flask app
@@ -155,6 +302,16 @@ def start_dashboard():
         print(f"\n❌ Dashboard error: {e}")
         print("Please check the logs for more details")
 
+def _say_goodbye():
+    print("👋 Goodbye!")
+
+# Next-step menu choices, dispatched by the key the user enters
+_MENU_ACTIONS = {
+    '1': start_dashboard,
+    '2': run_quick_test,
+    '3': _say_goodbye
+}
+
 def main():
     """Main setup function"""
     print_header()
@@ -164,21 +321,29 @@ def main():
         input("Press Enter to exit...")
         return
     
-    print("\n📁 Checking required files...")
-    if not check_files():
-        print("\n❌ Some required files are missing.")
-        print("Please ensure all files are in the current directory:")
-        print("  - credentials.json (your Gmail API credentials)")
-        print("  - email_processor.py, app.py, dashboard.html")
-        print("  - requirements.txt")
-        input("\nPress Enter to exit...")
-        return
-    
-    # Install dependencies
-    print("\n" + "="*50)
-    if not install_dependencies():
-        input("Press Enter to exit...")
-        return
+    # Skip file and dependency checks when nothing has changed since the last successful setup
+    if setup_already_validated():
+        print("\n✅ Files and dependencies unchanged since last setup, skipping checks")
+    else:
+        print("\n📁 Checking required files...")
+        if not check_files():
+            bprint(
+                "\n❌ Some required files are missing.",
+                "Please ensure all files are in the current directory:",
+                "  - credentials.json (your Gmail API credentials)",
+                "  - email_processor.py, app.py, dashboard.html",
+                "  - requirements.txt"
+            )
+            input("\nPress Enter to exit...")
+            return
+        
+        # Install dependencies
+        print("\n" + "="*50)
+        if not install_dependencies():
+            input("Press Enter to exit...")
+            return
+        
+        save_setup_state()
     
     # Create config if it doesn't exist
     if not os.path.exists('config.json'):
@@ -190,11 +355,13 @@ def main():
     # Test Gmail authentication
     print("\n" + "="*50)
     if not test_gmail_auth():
-        print("\n❌ Gmail authentication failed.")
-        print("Please check:")
-        print("  1. credentials.json is valid")
-        print("  2. Gmail API is enabled in Google Cloud Console")
-        print("  3. OAuth consent screen is configured")
+        bprint(
+            "\n❌ Gmail authentication failed.",
+            "Please check:",
+            "  1. credentials.json is valid",
+            "  2. Gmail API is enabled in Google Cloud Console",
+            "  3. OAuth consent screen is configured"
+        )
         
         choice = input("\nContinue anyway? (y/n): ").lower().strip()
         if choice != 'y':
@@ -205,27 +372,24 @@ def main():
     run_quick_test()
     
     # Ask what to do next
-    print("\n" + "="*50)
-    print("🎉 Setup completed successfully!")
-    print("\nWhat would you like to do next?")
-    print("1. Start web dashboard (recommended)")
-    print("2. Run processor once and exit")
-    print("3. Exit")
+    bprint(
+        "\n" + "="*50,
+        "🎉 Setup completed successfully!",
+        "\nWhat would you like to do next?",
+        "1. Start web dashboard (recommended)",
+        "2. Run processor once and exit",
+        "3. Exit"
+    )
     
     while True:
         choice = input("\nEnter your choice (1-3): ").strip()
         
-        if choice == '1':
-            start_dashboard()
-            break
-        elif choice == '2':
-            run_quick_test()
-            break
-        elif choice == '3':
-            print("👋 Goodbye!")
-            break
-        else:
+        action = _MENU_ACTIONS.get(choice)
+        if action is None:
             print("❌ Invalid choice. Please enter 1, 2, or 3.")
+            continue
+        action()
+        break
     
     input("\nPress Enter to exit...")
 